@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from rest_framework import serializers
+
+BATCH_ADDED = 'added'
+BATCH_EXISTS = 'exists'
+BATCH_DELETED = 'deleted'
+BATCH_NOT_FOUND = 'not_found'
+BATCH_FORBIDDEN = 'forbidden'
+
+
+class BatchIdsSerializer(serializers.Serializer):
+    """Список id объектов для пакетного запроса"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=settings.BATCH_MAX_SIZE
+    )
+
+
+def get_batch_ids(request):
+    """Возвращает id из тела запроса без повторов, в исходном порядке"""
+    serializer = BatchIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return list(dict.fromkeys(serializer.validated_data['ids']))
+
+
+def add_batch(model, field, user, ids, forbidden_ids=()):
+    """
+    Создает связи model пользователя user с объектами ids
+    по полю field. Существование объектов и уже созданные связи
+    проверяются одним запросом, новые связи создаются одним bulk_create.
+    Если часть связей успела создать параллельная транзакция,
+    связи создаются по одной, каждая в своей точке сохранения.
+    Возвращает статусы по каждому id и список id объектов,
+    связи с которыми действительно созданы этим вызовом.
+    """
+    statuses = dict.fromkeys(ids, BATCH_NOT_FOUND)
+    forbidden_ids = set(forbidden_ids) & statuses.keys()
+    statuses.update(dict.fromkeys(forbidden_ids, BATCH_FORBIDDEN))
+    target_model = model._meta.get_field(field).related_model
+    targets = target_model.objects.filter(
+        pk__in=statuses.keys() - forbidden_ids
+    ).annotate(
+        added=Exists(
+            model.objects.filter(user=user, **{field: OuterRef('pk')})
+        )
+    ).values_list('pk', 'added')
+    added_ids = []
+    for pk, added in targets:
+        if added:
+            statuses[pk] = BATCH_EXISTS
+        else:
+            statuses[pk] = BATCH_ADDED
+            added_ids.append(pk)
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(
+                [model(user=user, **{f'{field}_id': pk}) for pk in added_ids]
+            )
+    except IntegrityError:
+        added_ids = add_each(model, field, user, added_ids, statuses)
+    return statuses, added_ids
+
+
+def add_each(model, field, user, ids, statuses):
+    """
+    Создает связи по одной и возвращает id созданных. Для несозданных
+    статус уточняется: связь уже есть или объект успели удалить.
+    """
+    added_ids = []
+    failed_ids = []
+    for pk in ids:
+        try:
+            with transaction.atomic():
+                model.objects.create(user=user, **{f'{field}_id': pk})
+        except IntegrityError:
+            failed_ids.append(pk)
+        else:
+            added_ids.append(pk)
+    if failed_ids:
+        existing_ids = set(model.objects.filter(
+            user=user, **{f'{field}_id__in': failed_ids}
+        ).values_list(f'{field}_id', flat=True))
+        for pk in failed_ids:
+            statuses[pk] = (
+                BATCH_EXISTS if pk in existing_ids else BATCH_NOT_FOUND
+            )
+    return added_ids
+
+
+def delete_batch(model, field, user, ids):
+    """
+    Удаляет связи model пользователя user с объектами ids.
+    Удаляемые связи блокируются до конца транзакции,
+    поэтому вызывать нужно внутри transaction.atomic: одновременный
+    вызов дождется фиксации и не удалит (и не учтет в счетчиках
+    обработчиков post_delete) те же связи второй раз.
+    Возвращает статусы по каждому id и список id удаленных связей.
+    """
+    statuses = dict.fromkeys(ids, BATCH_NOT_FOUND)
+    deleted_ids = list(
+        model.objects.select_for_update().filter(
+            user=user, **{f'{field}_id__in': ids}
+        ).values_list(f'{field}_id', flat=True)
+    )
+    if deleted_ids:
+        model.objects.filter(
+            user=user, **{f'{field}_id__in': deleted_ids}
+        ).delete()
+    statuses.update(dict.fromkeys(deleted_ids, BATCH_DELETED))
+    return statuses, deleted_ids
+
+
+def batch_results(statuses):
+    return {
+        'results': [
+            {'id': pk, 'status': status} for pk, status in statuses.items()
+        ]
+    }
@@ -0,0 +1,533 @@
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from urllib.parse import urlsplit
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from rest_framework.authtoken.models import Token
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.shopping_list import add_recipes_to_shopping_list
+from users.models import Subscription, User
+from .profiling import QueryCollector
+
+BENCHMARK_TAGS = (
+    ('завтрак', '#E26C2D', 'breakfast'),
+    ('обед', '#49B64E', 'lunch'),
+    ('ужин', '#8775D2', 'dinner'),
+    ('десерт', '#F0C808', 'dessert'),
+    ('выпечка', '#D7263D', 'bakery'),
+    ('напитки', '#1B998B', 'drinks'),
+)
+UNITS = ('г', 'мл', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+DEEP_PAGE_SIZE = 20
+CURSOR_WALK_SIZE = 100
+
+
+def bulk_create(model, objects, batch_size=2000):
+    model.objects.bulk_create(
+        objects, batch_size=batch_size, ignore_conflicts=True
+    )
+
+
+def random_pairs(rng, left_ids, right_ids, count, exclude_equal=False):
+    pairs = set()
+    attempts = count * 3
+    while len(pairs) < count and attempts:
+        attempts -= 1
+        pair = (rng.choice(left_ids), rng.choice(right_ids))
+        if exclude_equal and pair[0] == pair[1]:
+            continue
+        pairs.add(pair)
+    return sorted(pairs)
+
+
+def seed_dataset(users, recipes, ingredients, ingredients_per_recipe,
+                 favorites, subscriptions, shopping_carts, seed):
+    """
+    Заполняет пустую БД синтетическими данными пачками bulk_create.
+    При одинаковых параметрах и seed данные совпадают.
+    """
+    rng = random.Random(seed)
+    password = make_password('benchmark')
+    bulk_create(User, [
+        User(
+            id=user_id, email=f'user{user_id}@benchmark.local',
+            username=f'user{user_id}', first_name='Имя',
+            last_name='Фамилия', password=password
+        )
+        for user_id in range(1, users + 1)
+    ])
+    bulk_create(Ingredient, [
+        Ingredient(
+            id=ingredient_id, name=f'ингредиент {ingredient_id}',
+            measurement_unit=rng.choice(UNITS)
+        )
+        for ingredient_id in range(1, ingredients + 1)
+    ])
+    bulk_create(Tag, [
+        Tag(id=tag_id, name=name, color=color, slug=slug)
+        for tag_id, (name, color, slug) in enumerate(BENCHMARK_TAGS, 1)
+    ])
+    user_ids = list(range(1, users + 1))
+    ingredient_ids = list(range(1, ingredients + 1))
+    tag_ids = list(range(1, len(BENCHMARK_TAGS) + 1))
+    recipe_ids = list(range(1, recipes + 1))
+    bulk_create(Recipe, [
+        Recipe(
+            id=recipe_id, author_id=rng.choice(user_ids),
+            name=f'Рецепт {recipe_id}', image='recipes/benchmark.png',
+            text='Описание рецепта. ' * 20,
+            cooking_time=rng.randint(5, 180)
+        )
+        for recipe_id in recipe_ids
+    ])
+    bulk_create(Recipe.tags.through, [
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rng.sample(tag_ids, rng.randint(1, 3))
+    ])
+    per_recipe = min(ingredients_per_recipe, ingredients)
+    bulk_create(IngredientInRecipe, [
+        IngredientInRecipe(
+            recipe_id=recipe_id, ingredient_id=ingredient_id,
+            amount=rng.randint(1, 500)
+        )
+        for recipe_id in recipe_ids
+        for ingredient_id in rng.sample(ingredient_ids, per_recipe)
+    ])
+    for model, right_field, right_ids, count in (
+        (Favorite, 'recipe_id', recipe_ids, favorites),
+        (ShoppingCart, 'recipe_id', recipe_ids, shopping_carts),
+        (Subscription, 'author_id', user_ids, subscriptions),
+    ):
+        bulk_create(model, [
+            model(user_id=user_id, **{right_field: right_id})
+            for user_id, right_id in random_pairs(
+                rng, user_ids, right_ids, count,
+                exclude_equal=model is Subscription
+            )
+        ])
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(
+            no_style(), [User, Ingredient, Tag, Recipe]
+        ):
+            cursor.execute(sql)
+    call_command('reconcile_counters', stdout=StringIO())
+    call_command('rebuild_shopping_lists', stdout=StringIO())
+
+
+def get_deep_offset(recipes):
+    """Смещение глубокой страницы: 90% рецептов, кратно CURSOR_WALK_SIZE"""
+    return recipes * 9 // 10 // CURSOR_WALK_SIZE * CURSOR_WALK_SIZE
+
+
+def follow_cursor(offset):
+    """
+    Проходит курсорную выдачу по ссылкам next страницами
+    по CURSOR_WALK_SIZE рецептов и возвращает адрес страницы
+    из DEEP_PAGE_SIZE рецептов, начинающейся после offset рецептов.
+    """
+    client = Client(SERVER_NAME='localhost')
+    url = f'/api/recipes/?pagination=cursor&limit={CURSOR_WALK_SIZE}'
+    for _ in range(offset // CURSOR_WALK_SIZE):
+        next_url = json.loads(client.get(url).content)['next']
+        if next_url is None:
+            break
+        url = next_url
+    url = urlsplit(replace_query_param(url, 'limit', DEEP_PAGE_SIZE))
+    return f'{url.path}?{url.query}'
+
+
+def deep_cursor_url(recipes):
+    """
+    Функция адреса для глубокой страницы курсорной выдачи.
+    Курсор находится при первом вызове, когда данные уже созданы.
+    """
+    url = None
+
+    def get_url(i):
+        nonlocal url
+        if url is None:
+            url = follow_cursor(get_deep_offset(recipes))
+        return url
+
+    return get_url
+
+
+def get_scenarios(recipes):
+    """
+    Сценарии: имя, функция адреса по номеру запроса
+    и нужна ли авторизация. Сценарии recipes_list_deep_*
+    запрашивают одну и ту же глубокую страницу по номеру (OFFSET)
+    и по курсору, полученному переходами по ссылкам next.
+    """
+    deep_page = get_deep_offset(recipes) // DEEP_PAGE_SIZE + 1
+    return (
+        ('recipes_list', lambda i: '/api/recipes/', False),
+        ('recipes_list_auth', lambda i: '/api/recipes/', True),
+        ('recipes_list_tags',
+         lambda i: '/api/recipes/?tags=breakfast&tags=dinner', False),
+        ('recipes_list_author',
+         lambda i: f'/api/recipes/?author={i % 10 + 1}', False),
+        ('recipes_list_favorited',
+         lambda i: '/api/recipes/?is_favorited=1', True),
+        ('recipes_list_popular',
+         lambda i: '/api/recipes/?ordering=popular', True),
+        ('recipes_list_cursor',
+         lambda i: '/api/recipes/?pagination=cursor&limit=20', True),
+        ('recipes_list_deep_page',
+         lambda i: f'/api/recipes/?page={deep_page}&limit={DEEP_PAGE_SIZE}',
+         True),
+        ('recipes_list_deep_cursor', deep_cursor_url(recipes), True),
+        ('recipe_detail',
+         lambda i: f'/api/recipes/{i % recipes + 1}/', False),
+        ('recipe_detail_auth',
+         lambda i: f'/api/recipes/{i % recipes + 1}/', True),
+        ('subscriptions',
+         lambda i: '/api/users/subscriptions/?recipes_limit=3', True),
+        ('ingredient_search',
+         lambda i: f'/api/ingredients/?name=ингредиент {i % 100}', False),
+        ('ingredients_catalog', lambda i: '/api/ingredients/', False),
+        ('download_shopping_cart',
+         lambda i: '/api/recipes/download_shopping_cart/', True),
+    )
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = (len(values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+def summarize(latencies, statuses, elapsed):
+    return {
+        'requests': len(latencies),
+        'statuses': statuses,
+        'latency_ms': {
+            'min': round(min(latencies), 3),
+            'mean': round(statistics.mean(latencies), 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(max(latencies), 3),
+        },
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+    }
+
+
+def count_status(statuses, response):
+    statuses[str(response.status_code)] = (
+        statuses.get(str(response.status_code), 0) + 1
+    )
+
+
+def clear_caches():
+    """Очищает все кэши: следующий запрос выполняется с холодным кэшем"""
+    for cache in caches.all():
+        cache.clear()
+
+
+def measure(client, get_url, requests, warmup, before_request=None):
+    """
+    Выполняет запросы и возвращает статистику по ним.
+    before_request вызывается перед каждым замеряемым запросом
+    и в замер не входит. X-Cache ответов считается в cache_hits.
+    """
+    for i in range(warmup):
+        response = client.get(get_url(i))
+        if response.streaming:
+            b''.join(response.streaming_content)
+    latencies = []
+    queries = []
+    statuses = {}
+    cache_hits = 0
+    started = time.perf_counter()
+    for i in range(requests):
+        url = get_url(i)
+        if before_request is not None:
+            paused = time.perf_counter()
+            before_request()
+            started += time.perf_counter() - paused
+        collector = QueryCollector()
+        request_started = time.perf_counter()
+        with connection.execute_wrapper(collector):
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        queries.append(collector.count)
+        count_status(statuses, response)
+        cache_hits += response.get('X-Cache') == 'HIT'
+    result = summarize(latencies, statuses, time.perf_counter() - started)
+    result['cache_hits'] = cache_hits
+    result['queries'] = {
+        'min': min(queries),
+        'mean': round(statistics.mean(queries), 2),
+        'max': max(queries),
+    }
+    return result
+
+
+def measure_wsgi(token, get_url, requests, concurrency,
+                 before_request=None):
+    """
+    Запросы через WSGI-обработчик из concurrency потоков,
+    как у синхронных воркеров с потоками.
+    """
+    local = threading.local()
+    headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+
+    def request(i):
+        if not hasattr(local, 'client'):
+            local.client = Client(SERVER_NAME='localhost', **headers)
+        if before_request is not None:
+            before_request()
+        request_started = time.perf_counter()
+        response = local.client.get(get_url(i))
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return time.perf_counter() - request_started, response
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(request, range(requests)))
+
+
+def measure_asgi(token, get_url, requests, concurrency,
+                 before_request=None):
+    """
+    Запросы через ASGI-обработчик в одном цикле событий,
+    не больше concurrency одновременно.
+    """
+    headers = {'authorization': f'Token {token}'} if token else {}
+
+    async def run():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(i):
+            async with semaphore:
+                if before_request is not None:
+                    before_request()
+                request_started = time.perf_counter()
+                response = await client.get(get_url(i), **headers)
+                return time.perf_counter() - request_started, response
+
+        return await asyncio.gather(*(request(i) for i in range(requests)))
+
+    return asyncio.run(run())
+
+
+CONCURRENT_SERVERS = {'wsgi': measure_wsgi, 'asgi': measure_asgi}
+
+
+def measure_concurrent(server, token, get_url, requests, warmup,
+                       concurrency, before_request=None):
+    """
+    Выполняет запросы с заданной конкурентностью
+    и возвращает статистику по ним. Адреса вычисляются до замеров.
+    before_request вызывается перед каждым запросом вне замера,
+    но при очистке кэшей она затрагивает и выполняющиеся запросы.
+    """
+    measure_server = CONCURRENT_SERVERS[server]
+    urls = [get_url(i) for i in range(max(requests, warmup))]
+    if warmup:
+        measure_server(token, urls.__getitem__, warmup, concurrency)
+    started = time.perf_counter()
+    timings = measure_server(
+        token, urls.__getitem__, requests, concurrency, before_request
+    )
+    elapsed = time.perf_counter() - started
+    statuses = {}
+    for _, response in timings:
+        count_status(statuses, response)
+    result = summarize(
+        [duration * 1000 for duration, _ in timings], statuses, elapsed
+    )
+    result['concurrency'] = concurrency
+    return result
+
+
+class QueryLatency:
+    """
+    Задержка перед каждым SQL-запросом, имитирующая сетевую
+    задержку до сервера БД. Устанавливается на все соединения.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=connection, **kwargs):
+        if self.seconds and self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        connection_created.connect(self.install)
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.install)
+        if self in connection.execute_wrappers:
+            connection.execute_wrappers.remove(self)
+
+
+def get_benchmark_token():
+    user = User.objects.order_by('id').first()
+    token, _ = Token.objects.get_or_create(user=user)
+    return token.key
+
+
+def get_cache_modes(auth):
+    """
+    Режимы кэша сценария: суффикс имени и функция перед запросом.
+    Анонимные ответы берутся из кэша ответов, поэтому анонимные
+    сценарии замеряются еще и с холодным кэшем (:cold),
+    очищаемым перед каждым запросом.
+    """
+    if auth:
+        return (('', None),)
+    return (('', None), (':cold', clear_caches))
+
+
+def run_benchmark(recipes, requests, warmup, only=None):
+    token = get_benchmark_token()
+    anonymous = Client(SERVER_NAME='localhost')
+    authenticated = Client(
+        SERVER_NAME='localhost', HTTP_AUTHORIZATION=f'Token {token}'
+    )
+    results = {}
+    for name, get_url, auth in get_scenarios(recipes):
+        if only and name not in only:
+            continue
+        for suffix, before_request in get_cache_modes(auth):
+            results[f'{name}{suffix}'] = measure(
+                authenticated if auth else anonymous, get_url, requests,
+                warmup, before_request
+            )
+    return results
+
+
+def run_concurrency_benchmark(server, levels, recipes, requests, warmup,
+                              only=None):
+    """
+    Замеры сценариев при каждом уровне конкурентности из levels.
+    Результат сценария name при уровне N хранится под ключом name@N,
+    с холодным кэшем - под ключом name:cold@N.
+    """
+    token = get_benchmark_token()
+    results = {}
+    for name, get_url, auth in get_scenarios(recipes):
+        if only and name not in only:
+            continue
+        for suffix, before_request in get_cache_modes(auth):
+            for concurrency in levels:
+                results[f'{name}{suffix}@{concurrency}'] = (
+                    measure_concurrent(
+                        server, token if auth else None, get_url, requests,
+                        warmup, concurrency, before_request
+                    )
+                )
+    return results
+
+
+def measure_cart_memory(sizes):
+    """
+    Пиковый объем памяти (tracemalloc) при выгрузке Списка покупок
+    для корзин из sizes рецептов. Корзина отдельного пользователя
+    дополняется рецептами до каждого размера по возрастанию,
+    ответ читается по частям без накопления в памяти.
+    """
+    user = User.objects.create(
+        username='cart_benchmark', email='cart@benchmark.local'
+    )
+    token = Token.objects.create(user=user)
+    client = Client(
+        SERVER_NAME='localhost', HTTP_AUTHORIZATION=f'Token {token.key}'
+    )
+    recipe_ids = list(Recipe.objects.order_by('id').values_list(
+        'id', flat=True
+    )[:max(sizes)])
+    results = {}
+    in_cart = 0
+    for size in sorted(set(sizes)):
+        added = recipe_ids[in_cart:size]
+        bulk_create(ShoppingCart, [
+            ShoppingCart(user=user, recipe_id=recipe_id)
+            for recipe_id in added
+        ])
+        add_recipes_to_shopping_list(user.id, added)
+        in_cart = size
+        tracemalloc.start()
+        try:
+            response = client.get('/api/recipes/download_shopping_cart/')
+            content_length = sum(
+                len(chunk) for chunk in response.streaming_content
+            )
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results[str(size)] = {
+            'rows': ShoppingListItem.objects.filter(
+                user=user, total__gt=0
+            ).count(),
+            'status': response.status_code,
+            'bytes': content_length,
+            'peak_kib': round(peak / 1024, 1),
+        }
+    return results
+
+
+def compare_reports(baseline, report):
+    """
+    Изменение p50, p95, пропускной способности и числа запросов
+    относительно baseline
+    """
+    changes = {}
+    for name, result in report['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        changes[name] = {}
+        for metric in ('p50', 'p95'):
+            before = base['latency_ms'][metric]
+            after = result['latency_ms'][metric]
+            changes[name][metric] = {
+                'baseline': before,
+                'current': after,
+                'change_percent': (
+                    round((after - before) / before * 100, 1)
+                    if before else None
+                ),
+            }
+        changes[name]['throughput_rps'] = {
+            'baseline': base['throughput_rps'],
+            'current': result['throughput_rps'],
+        }
+        if 'queries' in base and 'queries' in result:
+            changes[name]['queries_mean'] = {
+                'baseline': base['queries']['mean'],
+                'current': result['queries']['mean'],
+            }
+    return changes
@@ -0,0 +1,182 @@
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from recipes.models import Ingredient, Tag
+
+
+class VersionedCache:
+    """
+    Данные хранятся в кэше под текущей версией, при изменении
+    исходных данных версия меняется и старые записи
+    больше не читаются, а вытесняются из кэша по времени.
+    Смену версии видят только процессы с тем же бэкендом кэша:
+    при нескольких процессах нужен общий кэш (memcached,
+    DatabaseCache), с LocMemCache каждый процесс хранит свою версию.
+    """
+    prefix = None
+    cache_alias = 'default'
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = f'{self.prefix}:{name}:version'
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, uuid.uuid4().hex, None)
+            version = self.cache.get(self.version_key)
+        return version
+
+    def invalidate(self):
+        self.cache.set(self.version_key, uuid.uuid4().hex, None)
+
+
+class CatalogCache(VersionedCache):
+    """
+    Кэш редко меняющегося справочника (теги, ингредиенты).
+    Хранит готовые к выдаче данные под текущей версией справочника.
+    Версия меняется при любом изменении справочника,
+    после чего данные собираются заново при первом обращении.
+    """
+    prefix = 'catalog'
+
+    def __init__(self, name, model, fields):
+        super().__init__(name)
+        self.model = model
+        self.fields = fields
+
+    def get_payload_key(self, version):
+        return f'{self.prefix}:{self.name}:{version}'
+
+    def get_cached(self):
+        """
+        Возвращает версию справочника и его данные из кэша,
+        без обращения к БД. Если данных в кэше нет, вместо них None.
+        """
+        version = self.get_version()
+        return version, self.cache.get(self.get_payload_key(version))
+
+    def get(self):
+        """Возвращает версию справочника и его данные"""
+        version, payload = self.get_cached()
+        if payload is None:
+            payload = list(self.model.objects.values(*self.fields))
+            self.cache.set(
+                self.get_payload_key(version), payload,
+                settings.CATALOG_CACHE_TIMEOUT
+            )
+        return version, payload
+
+    def get_ids(self):
+        return {item['id'] for item in self.get()[1]}
+
+
+class ResponseCache(VersionedCache):
+    """
+    Кэш данных ответов API в отдельном кэше 'responses'.
+    Ключ ответа строится из версии и описания запроса.
+    Считает попадания и промахи в пределах процесса.
+    """
+    prefix = 'responses'
+    cache_alias = 'responses'
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_key(self, request_key):
+        digest = hashlib.md5(request_key.encode()).hexdigest()
+        return f'{self.prefix}:{self.name}:{self.get_version()}:{digest}'
+
+    def get(self, request_key, count_miss=True):
+        """
+        count_miss=False для предварительной проверки кэша,
+        после которой при промахе ответ все равно ищется в кэше.
+        """
+        data = self.cache.get(self.get_key(request_key))
+        with self._lock:
+            if data is not None:
+                self.hits += 1
+            elif count_miss:
+                self.misses += 1
+        return data
+
+    def set(self, request_key, data):
+        self.cache.set(
+            self.get_key(request_key), data, settings.RESPONSE_CACHE_TIMEOUT
+        )
+
+    def get_stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+class FragmentCache(VersionedCache):
+    """
+    Кэш сериализованных фрагментов объектов, не зависящих
+    от пользователя. Ключ фрагмента складывается из общей версии
+    (меняется при изменении связанных данных, например тегов),
+    версии объекта (меняется при изменении самого объекта)
+    и адреса сервера, так как ссылки во фрагментах абсолютные.
+    """
+    prefix = 'fragments'
+    cache_alias = 'responses'
+
+    def get_object_version_key(self, pk):
+        return f'{self.prefix}:{self.name}:object:{pk}'
+
+    def get_object_versions(self, pks):
+        keys = {self.get_object_version_key(pk): pk for pk in pks}
+        versions = self.cache.get_many(keys)
+        for key in keys.keys() - versions.keys():
+            self.cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = self.cache.get(key)
+        return {keys[key]: version for key, version in versions.items()}
+
+    def invalidate_objects(self, pks):
+        self.cache.set_many(
+            {
+                self.get_object_version_key(pk): uuid.uuid4().hex
+                for pk in pks
+            },
+            None
+        )
+
+    def get_keys(self, pks, host):
+        version = self.get_version()
+        host = hashlib.md5(host.encode()).hexdigest()
+        return {
+            pk: f'{self.prefix}:{self.name}:{version}:{pk}:{object_version}:'
+                f'{host}'
+            for pk, object_version in self.get_object_versions(pks).items()
+        }
+
+    def get_many(self, pks, host):
+        """Возвращает ключи фрагментов и найденные фрагменты по pk"""
+        keys = self.get_keys(pks, host)
+        fragments = self.cache.get_many(keys.values())
+        return keys, {
+            pk: fragments[key] for pk, key in keys.items() if key in fragments
+        }
+
+    def set_many(self, fragments):
+        """Сохраняет фрагменты, переданные по ключам из get_many"""
+        self.cache.set_many(fragments, settings.FRAGMENT_CACHE_TIMEOUT)
+
+
+tag_catalog = CatalogCache('tags', Tag, ('id', 'name', 'color', 'slug'))
+ingredient_catalog = CatalogCache(
+    'ingredients', Ingredient, ('id', 'name', 'measurement_unit')
+)
+recipe_responses = ResponseCache('recipes')
+recipe_fragments = FragmentCache('recipes')
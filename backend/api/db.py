@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='db'
+)
+
+
+def request_health_checks():
+    """
+    Проверка постоянных соединений с БД, как CONN_HEALTH_CHECKS
+    в Django 4.1: в начале запроса открытые соединения помечаются,
+    а проверяются при первом SQL-запросе (check_connection_health),
+    поэтому запросы без обращения к БД проверку не выполняют.
+    Соединение, которое драйвер уже считает закрытым,
+    закрывается сразу.
+    """
+    for connection in connections.all():
+        if (connection.connection is None
+                or not connection.settings_dict.get('CONN_HEALTH_CHECKS')):
+            continue
+        if getattr(connection.connection, 'closed', False):
+            connection.close()
+        else:
+            connection.health_check_needed = True
+
+
+def check_connection_health(execute, sql, params, many, context):
+    """
+    Обертка выполнения SQL-запросов: перед первым запросом после
+    request_health_checks проверяет соединение и при разрыве
+    переоткрывает его вместе с курсором текущего запроса.
+    """
+    connection = context['connection']
+    if getattr(connection, 'health_check_needed', False):
+        connection.health_check_needed = False
+        if not connection.in_atomic_block and not connection.is_usable():
+            connection.close()
+            connection.connect()
+            cursor = context['cursor']
+            cursor.cursor = connection.create_cursor(
+                getattr(cursor.cursor, 'name', None)
+            )
+    return execute(sql, params, many, context)
+
+
+def database_sync_to_async(func):
+    """
+    Асинхронная обертка для синхронного кода, работающего с БД.
+    Код выполняется в пуле из ASYNC_DB_THREADS потоков, поэтому
+    одновременно открыто не больше ASYNC_DB_THREADS соединений.
+    Соединения закрываются по тем же правилам (CONN_MAX_AGE),
+    что и в начале и конце обычного запроса.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        request_health_checks()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False, executor=db_executor)
+
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def uses_process_local_caches():
+    return all(
+        cache['BACKEND'] in PROCESS_LOCAL_CACHES
+        for cache in settings.CACHES.values()
+    )
+
+
+def cache_sync_to_async(func):
+    """
+    Асинхронная обертка для синхронного кода, читающего кэш.
+    Кэш в памяти процесса читается прямо в цикле событий,
+    а DatabaseCache и сетевые кэши (memcached, Redis) - в пуле
+    database_sync_to_async: синхронный вызов DatabaseCache в цикле
+    событий запрещен (SynchronousOnlyOperation), а сетевой
+    останавливает цикл на время ожидания ответа.
+    """
+    run_in_thread = database_sync_to_async(func)
+
+    async def run(*args, **kwargs):
+        if uses_process_local_caches():
+            return func(*args, **kwargs)
+        return await run_in_thread(*args, **kwargs)
+
+    return run
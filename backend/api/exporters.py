@@ -0,0 +1,55 @@
+import csv
+
+
+class ShoppingCartExporter:
+    """
+    Базовый класс выгрузки Списка покупок.
+    Принимает итератор строк (название, единица измерения, количество),
+    упорядоченных по единице измерения, и построчно отдает файл,
+    не собирая его целиком в памяти.
+    """
+    content_type = None
+    extension = None
+
+    def render(self, rows):
+        raise NotImplementedError
+
+
+class TextShoppingCartExporter(ShoppingCartExporter):
+    """Выгрузка в .txt, ингредиенты сгруппированы по единице измерения"""
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def render(self, rows):
+        current_unit = None
+        for name, measurement_unit, total in rows:
+            if measurement_unit != current_unit:
+                prefix = '' if current_unit is None else '\n'
+                current_unit = measurement_unit
+                yield f'{prefix}[{measurement_unit}]\n'
+            yield f'{name} - {total}{measurement_unit}\n'
+
+
+class EchoBuffer:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+class CsvShoppingCartExporter(ShoppingCartExporter):
+    """Выгрузка в .csv"""
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def render(self, rows):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            yield writer.writerow(row)
+
+
+SHOPPING_CART_EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in (TextShoppingCartExporter, CsvShoppingCartExporter)
+}
@@ -1,35 +1,140 @@
 import base64
-import imghdr
 import uuid
 
 import six
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
 from rest_framework import serializers
 
+from recipes.images import get_rendition_url, strip_image_metadata
+from .cache import tag_catalog
+
 
 class Base64ImageField(serializers.ImageField):
     """
     Поле для обработки загрузки изображений через
     необработанные данные.
     Bспользует base64 для кодирования и декодирования содержимого файла.
+    Данные декодируются частями сразу во временный файл,
+    размер изображения ограничен RECIPE_IMAGE_MAX_SIZE.
+    Принимает также файл, загруженный через multipart/form-data.
+    Изображение пересохраняется без метаданных (EXIF и пр.).
     """
+    default_error_messages = {
+        'max_size': 'Размер изображения не должен превышать {max_size} байт.',
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.max_size = kwargs.pop('max_size', None)
+        super().__init__(*args, **kwargs)
+
+    def get_max_size(self):
+        if self.max_size is not None:
+            return self.max_size
+        return settings.RECIPE_IMAGE_MAX_SIZE
 
     def to_internal_value(self, data):
+        max_size = self.get_max_size()
         if isinstance(data, six.string_types):
-            if 'data:' in data and ';base64,' in data:
-                header, data = data.split(';base64,')
-            try:
-                decoded_file = base64.b64decode(data)
-            except TypeError:
-                self.fail('invalid_image')
-            file_name = str(uuid.uuid4())[:12]
-            file_extension = self.get_file_extension(file_name, decoded_file)
-            complete_file_name = "%s.%s" % (file_name, file_extension, )
-            data = ContentFile(decoded_file, name=complete_file_name)
-        return super(Base64ImageField, self).to_internal_value(data)
+            data = self.decode_to_file(data, max_size)
+        elif getattr(data, 'size', 0) > max_size:
+            self.fail('max_size', max_size=max_size)
+        image_file = super(Base64ImageField, self).to_internal_value(data)
+        try:
+            return strip_image_metadata(image_file)
+        except (OSError, ValueError):
+            self.fail('invalid_image')
+
+    def decode_to_file(self, data, max_size):
+        offset = 0
+        if data.startswith('data:') and ';base64,' in data:
+            offset = data.index(';base64,') + len(';base64,')
+        if (len(data) - offset) * 3 // 4 > max_size:
+            self.fail('max_size', max_size=max_size)
+        decoded_file = TemporaryUploadedFile(
+            str(uuid.uuid4())[:12], None, None, None
+        )
+        chunk_size = settings.BASE64_DECODE_CHUNK_SIZE
+        remainder = ''
+        try:
+            for start in range(offset, len(data), chunk_size):
+                chunk = remainder + ''.join(
+                    data[start:start + chunk_size].split()
+                )
+                usable = len(chunk) - len(chunk) % 4
+                decoded_file.write(base64.b64decode(chunk[:usable]))
+                remainder = chunk[usable:]
+        except (TypeError, ValueError):
+            self.fail('invalid_image')
+        if remainder:
+            self.fail('invalid_image')
+        decoded_file.size = decoded_file.tell()
+        decoded_file.seek(0)
+        file_extension = self.get_file_extension(
+            decoded_file.name, decoded_file
+        )
+        if file_extension is None:
+            self.fail('invalid_image')
+        decoded_file.name = "%s.%s" % (decoded_file.name, file_extension, )
+        return decoded_file
 
     def get_file_extension(self, file_name, decoded_file):
-        extension = imghdr.what(file_name, decoded_file)
+        try:
+            with Image.open(decoded_file) as image:
+                extension = image.format.lower()
+        except (OSError, ValueError):
+            return None
+        finally:
+            decoded_file.seek(0)
         extension = "jpg" if extension == "jpeg" else extension
 
         return extension
+
+
+class ImageRenditionsField(serializers.ReadOnlyField):
+    """
+    Поле со ссылками на уменьшенные копии изображения.
+    Если задан rendition, возвращает ссылку на одну копию,
+    иначе словарь ссылок на все копии из IMAGE_RENDITIONS.
+    """
+
+    def __init__(self, rendition=None, **kwargs):
+        self.rendition = rendition
+        super().__init__(**kwargs)
+
+    def get_url(self, image, rendition):
+        url = get_rendition_url(image, rendition)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        if self.rendition is not None:
+            return self.get_url(value, self.rendition)
+        return {
+            rendition: self.get_url(value, rendition)
+            for rendition in settings.IMAGE_RENDITIONS
+        }
+
+
+class CachedTagPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    Поле для id тега, проверяющее его существование
+    по кэшу справочника тегов, без запроса к БД на каждый тег.
+    Возвращает id тега.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in tag_catalog.get_ids():
+            self.fail('does_not_exist', pk_value=data)
+        return pk
@@ -1,6 +1,8 @@
 import django_filters
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
 
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from .cache import tag_catalog
 
 
 class IngredientFilter(django_filters.FilterSet):
@@ -11,19 +13,50 @@ class IngredientFilter(django_filters.FilterSet):
         fields = ['name']
 
     def get_ingredient_by_name(self, queryset, name, value):
+        """
+        Поиск без учета регистра: сначала ингредиенты,
+        название которых начинается с value, затем содержащие value.
+        icontains и istartswith сравнивают UPPER(name) через LIKE,
+        в PostgreSQL их обслуживает триграммный GIN-индекс по UPPER(name).
+        """
         if value:
-            return queryset.filter(name__startswith=value)
+            return queryset.filter(name__icontains=value).annotate(
+                is_prefix_match=Case(
+                    When(name__istartswith=value, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField(),
+                )
+            ).order_by('is_prefix_match', 'name')
         return queryset
 
 
+def get_tag_choices():
+    """Варианты фильтра по тегам из кэша справочника тегов"""
+    return [(tag['slug'], tag['slug']) for tag in tag_catalog.get()[1]]
+
+
+RECIPE_ORDERING_CHOICES = (
+    ('popular', 'Популярные'),
+)
+
+
 class RecipeFilter(django_filters.FilterSet):
-    """Фильтр для Recipe по автору, тегу, избранному, списку покупок"""
-    tags = django_filters.AllValuesMultipleFilter(field_name='tags__slug')
+    """
+    Фильтр для Recipe по автору, тегу, избранному, списку покупок.
+    Все условия выражаются подзапросами EXISTS в запросе списка рецептов.
+    ordering=popular упорядочивает рецепты по числу добавлений в Избранное.
+    """
+    tags = django_filters.MultipleChoiceFilter(
+        choices=get_tag_choices, method='get_tags'
+    )
     is_favorited = django_filters.NumberFilter(method='get_is_favorited')
     is_in_shopping_cart = django_filters.NumberFilter(
         method='get_is_in_shopping_cart'
     )
     author = django_filters.CharFilter(field_name='author')
+    ordering = django_filters.ChoiceFilter(
+        choices=RECIPE_ORDERING_CHOICES, method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
@@ -31,24 +64,34 @@ class RecipeFilter(django_filters.FilterSet):
             'tags', 'author'
         ]
 
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__slug__in=value
+            )
+        ))
+
+    def get_ordering(self, queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by('-favorites_count', '-pub_date', '-id')
+        return queryset
+
     def get_is_favorited(self, queryset, name, value):
         if value == 1 and self.request.user.is_authenticated:
-            favorites = list(
+            return queryset.filter(Exists(
                 Favorite.objects.filter(
-                    user=self.request.user).values_list('recipe_id', flat=True)
-            )
-            fav_queryset = queryset.filter(id__in=favorites)
-            return fav_queryset
-        else:
-            return queryset
+                    user=self.request.user, recipe=OuterRef('pk')
+                )
+            ))
+        return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value == 1 and self.request.user.is_authenticated:
-            shopping_cart = list(
+            return queryset.filter(Exists(
                 ShoppingCart.objects.filter(
-                    user=self.request.user).values_list('recipe_id', flat=True)
-            )
-            sc_queryset = queryset.filter(id__in=shopping_cart)
-            return sc_queryset
-        else:
-            return queryset
+                    user=self.request.user, recipe=OuterRef('pk')
+                )
+            ))
+        return queryset
@@ -0,0 +1,185 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from api.benchmark import (CONCURRENT_SERVERS, QueryLatency, compare_reports,
+                           get_scenarios, measure_cart_memory, run_benchmark,
+                           run_concurrency_benchmark, seed_dataset)
+
+BENCHMARK_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'benchmark-{alias}',
+    }
+    for alias in ('default', 'responses')
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет задержки, пропускную способность и число SQL-запросов '
+        'основных эндпоинтов API. Создает отдельную тестовую БД, '
+        'заполняет ее синтетическими данными и удаляет после замеров, '
+        'рабочая БД и кэши не затрагиваются. Отчет выводится в JSON. '
+        'Анонимные сценарии замеряются с прогретым кэшем и с кэшем, '
+        'очищаемым перед каждым запросом (имя:cold).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=int, default=1000)
+        parser.add_argument('--shopping-carts', type=int, default=2000)
+        parser.add_argument(
+            '--seed', type=int, default=1,
+            help='Начальное значение генератора данных.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Число замеряемых запросов на сценарий.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Число прогревочных запросов на сценарий.'
+        )
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=[name for name, *_ in get_scenarios(1)],
+            help='Запустить только указанные сценарии.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+',
+            help=(
+                'Уровни конкурентности: вместо последовательных замеров '
+                'сценарии выполняются при каждом уровне.'
+            )
+        )
+        parser.add_argument(
+            '--server', choices=CONCURRENT_SERVERS, default='wsgi',
+            help=(
+                'Обработчик для замеров с --concurrency: wsgi (потоки) '
+                'или asgi (цикл событий). Асинхронные представления '
+                'включаются переменной окружения ASYNC_VIEWS=True.'
+            )
+        )
+        parser.add_argument(
+            '--db-latency', type=float, default=0,
+            help='Задержка перед каждым SQL-запросом в мс.'
+        )
+        parser.add_argument(
+            '--cart-sizes', type=int, nargs='+',
+            help=(
+                'Размеры корзины в рецептах, для которых замеряется '
+                'пиковый объем памяти при выгрузке Списка покупок.'
+            )
+        )
+        parser.add_argument(
+            '-o', '--output', help='Файл для отчета в JSON.'
+        )
+        parser.add_argument(
+            '--compare', help='Отчет предыдущего запуска для сравнения.'
+        )
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def run(self, options):
+        if options['concurrency']:
+            return run_concurrency_benchmark(
+                options['server'], options['concurrency'],
+                options['recipes'], options['requests'], options['warmup'],
+                options['scenarios']
+            )
+        return run_benchmark(
+            options['recipes'], options['requests'], options['warmup'],
+            options['scenarios']
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть больше нуля.')
+        if options['concurrency'] and min(options['concurrency']) < 1:
+            raise CommandError('--concurrency должно быть больше нуля.')
+        if options['cart_sizes'] and not (
+            0 < min(options['cart_sizes'])
+            and max(options['cart_sizes']) <= options['recipes']
+        ):
+            raise CommandError(
+                '--cart-sizes должны быть от 1 до --recipes.'
+            )
+        dataset = {
+            name: options[name]
+            for name in (
+                'users', 'recipes', 'ingredients', 'ingredients_per_recipe',
+                'favorites', 'subscriptions', 'shopping_carts', 'seed'
+            )
+        }
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            with override_settings(
+                CACHES=BENCHMARK_CACHES, PROFILING_ENABLED=False,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+            ):
+                seed_dataset(**dataset)
+                with QueryLatency(options['db_latency'] / 1000):
+                    results = self.run(options)
+                cart_memory = (
+                    measure_cart_memory(options['cart_sizes'])
+                    if options['cart_sizes'] else None
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        report = {
+            'meta': {
+                'commit': self.get_commit(),
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+            },
+            'dataset': dataset,
+            'options': {
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'concurrency': options['concurrency'],
+                'server': (
+                    options['server'] if options['concurrency'] else None
+                ),
+                'async_views': settings.ASYNC_VIEWS,
+                'db_latency_ms': options['db_latency'],
+            },
+            'results': results,
+        }
+        if cart_memory is not None:
+            report['cart_memory'] = cart_memory
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as baseline:
+                report['comparison'] = compare_reports(
+                    json.load(baseline), report
+                )
+        output = json.dumps(report, ensure_ascii=False, indent=2,
+                            sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,118 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from api.filters import RecipeFilter
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscription, User
+
+POSTGRESQL_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+SQLITE_SEQ_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?! USING)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для основных запросов API и сообщает '
+        'о последовательном сканировании таблиц. На почти пустой БД '
+        'планировщик может выбирать сканирование вместо индекса, '
+        'поэтому команду имеет смысл запускать на рабочих объемах данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plan', action='store_true',
+            help='Выводить план каждого запроса целиком.'
+        )
+        parser.add_argument(
+            '--fail-on-seq-scan', action='store_true',
+            help='Завершиться с ошибкой, если найдено сканирование таблицы.'
+        )
+
+    def get_hot_queries(self):
+        user = User.objects.order_by('id').first()
+        recipe = Recipe.objects.order_by('id').first()
+        tag_slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        if user is None or recipe is None:
+            raise CommandError('Для EXPLAIN нужны пользователь и рецепт в БД.')
+        feed = Recipe.objects.annotate(
+            favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+        return {
+            'recipe_feed': feed[:6],
+            'recipe_feed_cursor': feed.filter(
+                pub_date__lt=timezone.now()
+            ).order_by('-pub_date', '-id')[:6],
+            'recipe_feed_by_author': feed.filter(author=recipe.author_id)[:6],
+            'recipe_feed_by_tags': RecipeFilter().get_tags(
+                feed, 'tags', tag_slugs
+            )[:6],
+            'recipe_feed_favorited': feed.filter(Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ))[:6],
+            'recipe_feed_in_shopping_cart': feed.filter(Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ))[:6],
+            'recipe_ingredients': IngredientInRecipe.objects.filter(
+                recipe=recipe
+            ).values_list('ingredient_id', 'amount'),
+            'recipe_feed_popular': feed.order_by(
+                '-favorites_count', '-pub_date', '-id'
+            )[:6],
+            'recipe_shopping_cart_users': ShoppingCart.objects.filter(
+                recipe=recipe
+            ).values_list('user_id', flat=True),
+            'subscriptions': Subscription.objects.filter(
+                user=user
+            ).select_related('author').order_by('id')[:6],
+            'subscription_recipes': Recipe.objects.filter(
+                author__in=[recipe.author_id],
+                id__in=Subquery(
+                    Recipe.objects.filter(
+                        author=OuterRef('author')
+                    ).values('id')[:3]
+                ),
+            ),
+            'shopping_list_download': ShoppingListItem.objects.filter(
+                user=user, total__gt=0
+            ).order_by(
+                'ingredient__measurement_unit', 'ingredient__name'
+            ).values_list(
+                'ingredient__name', 'ingredient__measurement_unit', 'total'
+            ),
+            'ingredient_search': Ingredient.objects.filter(
+                name__istartswith='а'
+            ),
+        }
+
+    def find_seq_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            pattern = POSTGRESQL_SEQ_SCAN
+        else:
+            pattern = SQLITE_SEQ_SCAN
+        return sorted(set(pattern.findall(plan)))
+
+    def handle(self, *args, **options):
+        found = False
+        for name, queryset in self.get_hot_queries().items():
+            plan = queryset.explain()
+            seq_scans = self.find_seq_scans(plan)
+            if seq_scans:
+                found = True
+                self.stdout.write(self.style.WARNING(
+                    f'{name}: сканирование таблиц {", ".join(seq_scans)}'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+            if options['verbose_plan']:
+                self.stdout.write(plan)
+        if found and options['fail_on_seq_scan']:
+            raise CommandError('Найдено последовательное сканирование таблиц.')
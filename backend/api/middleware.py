@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+
+from .db import cache_sync_to_async
+from .profiling import (QueryCollector, current_collector, get_budget,
+                        get_profiling_settings, metrics_registry,
+                        slow_request_log)
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware:
+    """
+    Замеряет время ответа, число и время SQL-запросов каждого запроса.
+    Результаты добавляются в метрики /api/metrics/ и, если включено
+    server_timing, в заголовок Server-Timing. Превышение бюджета
+    представления для метода запроса пишется в лог,
+    самые медленные запросы сохраняются вместе с их SQL.
+    Включается PROFILING_ENABLED или через /api/metrics/profiling/.
+    Работает и при WSGI, и при ASGI: настройки из кэша читаются
+    через cache_sync_to_async, запросы к БД учитываются
+    через сборщик текущего запроса, в каком бы потоке они ни
+    выполнялись.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Признак, по которому Django вызывает middleware асинхронно
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        profiling_settings = get_profiling_settings()
+        if not profiling_settings['enabled']:
+            return self.get_response(request)
+        collector = QueryCollector(
+            collect_sql=profiling_settings['slow_requests'] > 0
+        )
+        token = current_collector.set(collector)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_collector.reset(token)
+        return self.process_profile(
+            request, response, collector, time.perf_counter() - started,
+            profiling_settings
+        )
+
+    async def __acall__(self, request):
+        profiling_settings = await cache_sync_to_async(
+            get_profiling_settings
+        )()
+        if not profiling_settings['enabled']:
+            return await self.get_response(request)
+        collector = QueryCollector(
+            collect_sql=profiling_settings['slow_requests'] > 0
+        )
+        token = current_collector.set(collector)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_collector.reset(token)
+        return self.process_profile(
+            request, response, collector, time.perf_counter() - started,
+            profiling_settings
+        )
+
+    def process_profile(self, request, response, collector, duration,
+                        profiling_settings):
+        view_name = (
+            request.resolver_match.view_name
+            if request.resolver_match is not None else 'unresolved'
+        )
+        budget = get_budget(view_name, request.method)
+        budget_exceeded = (
+            collector.count > budget['queries']
+            or duration > budget['duration']
+        )
+        if budget_exceeded:
+            logger.warning(
+                'Превышен бюджет %s %s: %.1f мс, SQL-запросов %s',
+                request.method, view_name, duration * 1000, collector.count
+            )
+        metrics_registry.record(
+            view_name, request.method, response.status_code, duration,
+            collector, budget_exceeded
+        )
+        slow_requests = profiling_settings['slow_requests']
+        if slow_requests > 0:
+            slow_request_log.add(slow_requests, duration, {
+                'view': view_name,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'queries': collector.queries,
+            })
+        if profiling_settings['server_timing']:
+            response['Server-Timing'] = (
+                f'app;dur={duration * 1000:.1f}, '
+                f'db;dur={collector.duration * 1000:.1f};'
+                f'desc="{collector.count} queries"'
+            )
+        return response
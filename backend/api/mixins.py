@@ -1,11 +1,25 @@
+from functools import update_wrapper
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import classonlymethod
 from rest_framework import status
 from rest_framework.mixins import (CreateModelMixin, DestroyModelMixin,
                                    ListModelMixin)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet
 
-from recipes.models import Recipe
+from recipes.counters import RECIPE_COUNTER_FIELDS, change_counters
+from recipes.models import Recipe, ShoppingCart
+from recipes.shopping_list import (add_recipes_to_shopping_list,
+                                   remove_recipes_from_shopping_list)
+from .batch import add_batch, batch_results, delete_batch, get_batch_ids
+from .db import cache_sync_to_async, database_sync_to_async
 
 
 class ListCreateDestroyMixin(ListModelMixin, CreateModelMixin,
@@ -15,35 +29,264 @@ class ListCreateDestroyMixin(ListModelMixin, CreateModelMixin,
     lookup_field = 'slug'
 
 
+class AsyncReadViewMixin:
+    """
+    Миксин асинхронного варианта вьюсета для развертывания через ASGI,
+    включается ASYNC_VIEWS. В Django 3.2 нет асинхронного ORM,
+    а синхронные представления при ASGI выполняются по очереди
+    в одном потоке. Поэтому ответ, который уже есть в кэше,
+    выдается без синхронного представления (cache_sync_to_async),
+    а остальные запросы выполняются синхронным представлением
+    в пуле потоков database_sync_to_async.
+    """
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):  # noqa: N805
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASYNC_VIEWS:
+            return view
+        run_view = database_sync_to_async(view)
+        get_cached_read_response = cache_sync_to_async(
+            cls.get_cached_read_response
+        )
+
+        async def async_view(request, *args, **kwargs):
+            if cls.can_use_cached_response(request):
+                response = await get_cached_read_response(
+                    request, view.actions.get('get'), kwargs
+                )
+                if response is not None:
+                    return cls.render_cached_response(response)
+            return await run_view(request, *args, **kwargs)
+
+        return update_wrapper(async_view, view)
+
+    @classmethod
+    def can_use_cached_response(cls, request):
+        """
+        Готовый ответ из кэша выдается только на GET-запрос
+        без токена, ожидающий JSON, а не страницу Browsable API.
+        """
+        return (
+            request.method == 'GET'
+            and 'HTTP_AUTHORIZATION' not in request.META
+            and 'text/html' not in request.META.get('HTTP_ACCEPT', '')
+            and api_settings.URL_FORMAT_OVERRIDE not in request.GET
+        )
+
+    @classmethod
+    def get_cached_read_response(cls, request, action, kwargs):
+        return None
+
+    @classmethod
+    def render_cached_response(cls, response):
+        renderer = JSONRenderer()
+        response.accepted_renderer = renderer
+        response.accepted_media_type = renderer.media_type
+        response.renderer_context = {}
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+class CatalogListMixin(AsyncReadViewMixin):
+    """
+    Миксин для выдачи справочника из кэша.
+    Ответ снабжается заголовком ETag, при совпадении
+    If-None-Match возвращается 304 без тела ответа.
+    """
+    catalog = None
+
+    @classmethod
+    def get_catalog_response(cls, request, version, payload):
+        etag = f'"{cls.catalog.name}-{version}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(payload)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        version, payload = self.catalog.get()
+        return self.get_catalog_response(request, version, payload)
+
+    @classmethod
+    def get_cached_read_response(cls, request, action, kwargs):
+        """Полный справочник без параметров запроса"""
+        if action != 'list' or request.GET:
+            return None
+        version, payload = cls.catalog.get_cached()
+        if payload is None:
+            return None
+        return cls.get_catalog_response(request, version, payload)
+
+
+class AnonymousResponseCacheMixin(AsyncReadViewMixin):
+    """
+    Миксин для кэширования ответов list/retrieve анонимным пользователям.
+    Ключ ответа строится из действия, id объекта, адреса сервера
+    (ссылки в ответе абсолютные) и нормализованных параметров
+    запроса из cache_query_params, прочие параметры не учитываются.
+    Кэшируются только успешные ответы. Заголовок X-Cache
+    показывает, взят ли ответ из кэша.
+    """
+    response_cache = None
+    cache_query_params = ()
+
+    @classmethod
+    def build_response_cache_key(cls, request, action, kwargs):
+        params = sorted(
+            (name, sorted(request.GET.getlist(name)))
+            for name in cls.cache_query_params
+            if name in request.GET
+        )
+        return '|'.join((
+            action,
+            str(kwargs.get(cls.lookup_url_kwarg or cls.lookup_field)),
+            request.build_absolute_uri('/'),
+            urlencode(params, doseq=True),
+        ))
+
+    def get_response_cache_key(self, request):
+        return self.build_response_cache_key(
+            request, self.action, self.kwargs
+        )
+
+    @classmethod
+    def get_hit_response(cls, data):
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        data = self.response_cache.get(key)
+        if data is not None:
+            return self.get_hit_response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            self.response_cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    @classmethod
+    def get_cached_read_response(cls, request, action, kwargs):
+        if action not in ('list', 'retrieve'):
+            return None
+        data = cls.response_cache.get(
+            cls.build_response_cache_key(request, action, kwargs),
+            count_miss=False
+        )
+        if data is None:
+            return None
+        return cls.get_hit_response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
 class AddDelRecipeViewMixin:
     """
     Миксин для добавления рецепта в Избранное/Список покупок,
     удаления рецепта из Избранного/Списка покупок.
     """
 
+    def on_objs_added(self, model, recipe_ids):
+        """
+        Поддерживает счетчики рецептов и сводный Список покупок
+        в актуальном состоянии. Счетчики при удалении уменьшают
+        обработчики post_delete, в том числе при каскадном удалении.
+        """
+        change_counters(Recipe, recipe_ids, RECIPE_COUNTER_FIELDS[model], 1)
+        if model is ShoppingCart:
+            add_recipes_to_shopping_list(self.request.user.id, recipe_ids)
+
+    def on_objs_deleted(self, model, recipe_ids):
+        if model is ShoppingCart:
+            remove_recipes_from_shopping_list(
+                self.request.user.id, recipe_ids
+            )
+
+    def on_obj_added(self, model, recipe_id):
+        self.on_objs_added(model, [recipe_id])
+
+    def on_obj_deleted(self, model, recipe_id):
+        self.on_objs_deleted(model, [recipe_id])
+
     def add_del_obj(self, obj_id, serializer, queryset):
+        """
+        Добавление выполняется одной вставкой: повторное добавление
+        отсекает ограничение уникальности в БД, а не предварительная
+        проверка, поэтому одновременные запросы не приводят к ошибке.
+        Удаление, как и пакетное, сначала блокирует строку
+        (delete_batch): без блокировки два одновременных DELETE
+        прочитали бы одну строку и оба отправили бы post_delete,
+        уменьшив счетчик дважды. Существование рецепта проверяется,
+        только если удалять было нечего.
+        """
         user = self.request.user
         if user.is_anonymous:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
+        model = queryset.model
         if self.request.method == 'POST':
-            serializer = serializer(
-                data=self.request.data, context={
-                    'pk': obj_id, 'user': self.request.user
-                }
+            recipe = get_object_or_404(
+                Recipe.objects.only(
+                    'id', 'name', 'image', 'renditions_ready', 'cooking_time'
+                ),
+                pk=obj_id
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save(
-                recipe_id=obj_id,
-                user=self.request.user
+            try:
+                with transaction.atomic():
+                    obj = model.objects.create(user=user, recipe=recipe)
+                    self.on_obj_added(model, recipe.id)
+            except IntegrityError:
+                return Response(
+                    {api_settings.NON_FIELD_ERRORS_KEY: [
+                        serializer.duplicate_message
+                    ]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(
+                serializer(obj).data, status=status.HTTP_201_CREATED
             )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
-            user = self.request.user
-            recipe = get_object_or_404(Recipe, pk=obj_id)
-            is_favorited_or_in_sc = queryset.filter(user=user, recipe=recipe)
-            if is_favorited_or_in_sc.exists:
-                is_favorited_or_in_sc.delete()
+            with transaction.atomic():
+                _, deleted = delete_batch(model, 'recipe', user, [obj_id])
+                if deleted:
+                    self.on_obj_deleted(model, obj_id)
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(Recipe.objects.only('id'), pk=obj_id)
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    def add_del_batch(self, model):
+        """
+        Пакетное добавление (POST) и удаление (DELETE) рецептов
+        по списку id. Возвращает статус по каждому рецепту.
+        """
+        recipe_ids = get_batch_ids(self.request)
+        with transaction.atomic():
+            if self.request.method == 'POST':
+                statuses, changed_ids = add_batch(
+                    model, 'recipe', self.request.user, recipe_ids
+                )
+                if changed_ids:
+                    self.on_objs_added(model, changed_ids)
             else:
-                return Response(status=status.HTTP_400_BAD_REQUEST)
+                statuses, changed_ids = delete_batch(
+                    model, 'recipe', self.request.user, recipe_ids
+                )
+                if changed_ids:
+                    self.on_objs_deleted(model, changed_ids)
+        return Response(batch_results(statuses))
@@ -1,6 +1,29 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class RecipeResultsSetPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Постраничная выдача рецептов по ключу (pub_date, id) без OFFSET
+    и подсчета COUNT(*). Результаты не сдвигаются при появлении
+    новых рецептов. Включается параметром pagination=cursor.
+    Сортировка ordering=popular с курсором не сочетается:
+    число добавлений в Избранное меняется между страницами.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('ordering'):
+            raise ValidationError({'ordering': [
+                'Сортировка недоступна при pagination=cursor'
+            ]})
+        return super().get_ordering(request, queryset, view)
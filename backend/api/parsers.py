@@ -0,0 +1,29 @@
+from django.conf import settings
+from rest_framework.parsers import JSONParser, MultiPartParser
+
+from .exceptions import RequestTooLarge
+
+
+class ContentLengthLimitMixin:
+    """
+    Миксин парсера, отклоняющий запрос по заголовку Content-Length
+    до чтения тела запроса, если тело больше RECIPE_REQUEST_MAX_SIZE.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > settings.RECIPE_REQUEST_MAX_SIZE:
+            raise RequestTooLarge()
+        return super().parse(stream, media_type, parser_context)
+
+
+class LimitedJSONParser(ContentLengthLimitMixin, JSONParser):
+    pass
+
+
+class LimitedMultiPartParser(ContentLengthLimitMixin, MultiPartParser):
+    pass
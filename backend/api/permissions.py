@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import permissions
 
 from users.models import ADMIN
@@ -32,3 +33,22 @@ class IsAuthorOrAdminOrReadOnly(permissions.BasePermission):
             and (request.user == obj.author
                  or (request.user.role == ADMIN))
         )
+
+
+class IsAdmin(permissions.BasePermission):
+    """Пермишен для Админа"""
+    def has_permission(self, request, view):
+        return bool(
+            request.user
+            and request.user.is_authenticated
+            and request.user.is_admin
+        )
+
+
+class IsMetricsClient(IsAdmin):
+    """Пермишен для сборщика метрик с разрешенного адреса или Админа"""
+    def has_permission(self, request, view):
+        return (
+            request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+            or super().has_permission(request, view)
+        )
@@ -0,0 +1,241 @@
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PROFILING_OVERRIDE_KEY = 'profiling:settings'
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+current_collector = ContextVar('current_collector', default=None)
+
+
+def get_profiling_settings():
+    """
+    Настройки профилирования из settings с учетом переопределения,
+    сохраненного в кэше. Читаются на каждый запрос, поэтому
+    включаются и выключаются без перезапуска. Переопределение
+    хранится в кэше default и действует на все процессы,
+    только если этот кэш общий для них.
+    """
+    profiling_settings = {
+        'enabled': settings.PROFILING_ENABLED,
+        'slow_requests': settings.PROFILING_SLOW_REQUESTS,
+        'server_timing': settings.PROFILING_SERVER_TIMING,
+    }
+    profiling_settings.update(cache.get(PROFILING_OVERRIDE_KEY) or {})
+    return profiling_settings
+
+
+def set_profiling_settings(**kwargs):
+    override = cache.get(PROFILING_OVERRIDE_KEY) or {}
+    override.update(kwargs)
+    cache.set(PROFILING_OVERRIDE_KEY, override, None)
+
+
+def get_budget(view_name, method):
+    if method == 'HEAD':
+        method = 'GET'
+    return settings.PROFILING_BUDGETS.get(
+        (view_name, method), settings.PROFILING_DEFAULT_BUDGET
+    )
+
+
+class QueryCollector:
+    """
+    Обертка выполнения SQL-запросов для connection.execute_wrapper.
+    Считает запросы и их суммарное время, при необходимости
+    запоминает текст запросов.
+    """
+
+    def __init__(self, collect_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.collect_sql = collect_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if self.collect_sql:
+                self.queries.append((round(duration * 1000, 2), sql))
+
+
+def collect_query(execute, sql, params, many, context):
+    """
+    Обертка, устанавливаемая на каждое соединение с БД.
+    Передает запрос сборщику текущего запроса HTTP, поэтому запросы
+    учитываются и при выполнении представления в другом потоке.
+    """
+    collector = current_collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+class ViewStats:
+    __slots__ = (
+        'requests', 'duration', 'queries', 'sql_duration',
+        'budget_exceeded', 'buckets'
+    )
+
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_duration = 0.0
+        self.budget_exceeded = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class MetricsRegistry:
+    """
+    Метрики запросов процесса по представлениям: число запросов,
+    время ответа (с гистограммой), число и время SQL-запросов,
+    превышения бюджета. Отдаются в текстовом формате Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(ViewStats)
+        self._statuses = defaultdict(int)
+
+    def record(self, view_name, method, status_code, duration, collector,
+               budget_exceeded):
+        with self._lock:
+            stats = self._views[view_name]
+            stats.requests += 1
+            stats.duration += duration
+            stats.queries += collector.count
+            stats.sql_duration += collector.duration
+            stats.budget_exceeded += budget_exceeded
+            stats.buckets[bisect_left(LATENCY_BUCKETS, duration)] += 1
+            self._statuses[view_name, method, status_code] += 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._statuses.clear()
+
+    def render(self, extra_metrics=()):
+        with self._lock:
+            views = {
+                name: (
+                    stats.requests, stats.duration, stats.queries,
+                    stats.sql_duration, stats.budget_exceeded,
+                    list(stats.buckets)
+                )
+                for name, stats in self._views.items()
+            }
+            statuses = dict(self._statuses)
+        lines = [
+            '# HELP foodgram_requests_total Обработано запросов.',
+            '# TYPE foodgram_requests_total counter',
+        ]
+        for (view, method, status), count in sorted(statuses.items()):
+            lines.append(
+                f'foodgram_requests_total{{view="{view}",method="{method}",'
+                f'status="{status}"}} {count}'
+            )
+        lines += [
+            '# HELP foodgram_request_duration_seconds Время ответа.',
+            '# TYPE foodgram_request_duration_seconds histogram',
+        ]
+        for view, (requests, duration, *_, buckets) in sorted(views.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append(
+                    f'foodgram_request_duration_seconds_bucket'
+                    f'{{view="{view}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f'foodgram_request_duration_seconds_sum{{view="{view}"}} '
+                f'{duration:.6f}'
+            )
+            lines.append(
+                f'foodgram_request_duration_seconds_count{{view="{view}"}} '
+                f'{requests}'
+            )
+        for metric, index, metric_type, help_text in (
+            ('foodgram_db_queries_total', 2, 'counter', 'SQL-запросов.'),
+            ('foodgram_db_query_duration_seconds_total', 3, 'counter',
+             'Время выполнения SQL-запросов.'),
+            ('foodgram_budget_exceeded_total', 4, 'counter',
+             'Запросов с превышением бюджета.'),
+        ):
+            lines += [
+                f'# HELP {metric} {help_text}',
+                f'# TYPE {metric} {metric_type}',
+            ]
+            for view, values in sorted(views.items()):
+                lines.append(f'{metric}{{view="{view}"}} {values[index]:g}')
+        for metric, metric_type, help_text, samples in extra_metrics:
+            lines += [
+                f'# HELP {metric} {help_text}',
+                f'# TYPE {metric} {metric_type}',
+            ]
+            for labels, value in samples:
+                label_text = ','.join(
+                    f'{name}="{label}"' for name, label in labels.items()
+                )
+                lines.append(f'{metric}{{{label_text}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class SlowRequestLog:
+    """
+    Самые медленные запросы процесса вместе с их SQL.
+    Запрос, попавший в число size самых медленных, пишется в лог.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+        self._counter = 0
+
+    def add(self, size, duration, entry):
+        with self._lock:
+            self._counter += 1
+            item = (duration, self._counter, entry)
+            if len(self._heap) < size:
+                heapq.heappush(self._heap, item)
+            elif self._heap and duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+            else:
+                return
+            while len(self._heap) > size:
+                heapq.heappop(self._heap)
+        logger.warning(
+            'Медленный запрос %s %s: %.1f мс, SQL-запросов %s\n%s',
+            entry['method'], entry['path'], entry['duration_ms'],
+            len(entry['queries']),
+            '\n'.join(
+                f'  {query_duration} мс: {sql}'
+                for query_duration, sql in entry['queries']
+            )
+        )
+
+    def get_entries(self):
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._heap, reverse=True)]
+
+    def reset(self):
+        with self._lock:
+            self._heap.clear()
+
+
+metrics_registry = MetricsRegistry()
+slow_request_log = SlowRequestLog()
@@ -0,0 +1,57 @@
+import threading
+from bisect import bisect_left
+
+from .cache import ingredient_catalog
+
+
+class IngredientSearchIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+    Названия хранятся в отсортированном массиве, поэтому совпадения
+    по началу названия находятся двоичным поиском, без обращения к БД.
+    Совпадения по началу названия выдаются раньше совпадений
+    по подстроке. Индекс перестраивается из кэша справочника
+    ингредиентов при смене его версии.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def build(self):
+        version, payload = ingredient_catalog.get()
+        ingredients = sorted(
+            payload, key=lambda ingredient: ingredient['name'].casefold()
+        )
+        keys = [ingredient['name'].casefold() for ingredient in ingredients]
+        return version, keys, ingredients
+
+    def get_snapshot(self):
+        version = ingredient_catalog.get_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0] != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot[0] != version:
+                    snapshot = self._snapshot = self.build()
+        return snapshot
+
+    def search(self, query, limit):
+        _, keys, ingredients = self.get_snapshot()
+        query = query.casefold()
+        results = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(results) < limit
+               and keys[position].startswith(query)):
+            results.append(ingredients[position])
+            position += 1
+        if len(results) < limit:
+            for key, ingredient in zip(keys, ingredients):
+                if query in key and not key.startswith(query):
+                    results.append(ingredient)
+                    if len(results) >= limit:
+                        break
+        return results
+
+
+ingredient_search_index = IngredientSearchIndex()
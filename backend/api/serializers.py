@@ -1,11 +1,18 @@
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import (Case, IntegerField, Manager, Prefetch, Value,
+                              When, prefetch_related_objects)
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from recipes.images import schedule_renditions
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                             ShoppingCart, Tag)
+from recipes.shopping_list import (get_recipe_amounts,
+                                   update_recipe_in_shopping_lists)
 from users.serializers import UserSerializer
-from .fields import Base64ImageField
+from .cache import recipe_fragments
+from .fields import (Base64ImageField, CachedTagPrimaryKeyField,
+                     ImageRenditionsField)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -62,9 +69,33 @@ class IngredientInRecipeSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+RECIPE_PREFETCH = (
+    'tags',
+    Prefetch(
+        'ingredient_in_recipe',
+        queryset=IngredientInRecipe.objects.select_related('ingredient')
+    ),
+)
+
+
+class CachedRecipeListSerializer(serializers.ListSerializer):
+    """
+    Сериализатор списка рецептов, берущий не зависящую от пользователя
+    часть данных рецептов из кэша фрагментов. Теги и ингредиенты
+    подгружаются одним запросом только для рецептов, которых нет в кэше.
+    """
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        return self.child.to_representation_many(recipes)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """
     Сериализатор модели Recipe для получение списка или одного рецепта.
+    Данные рецепта, кроме признаков is_favorited, is_in_shopping_cart
+    и is_subscribed автора, кэшируются, признаки вычисляются
+    для каждого запроса.
     """
     author = UserSerializer()
     tags = TagSerializer(many=True)
@@ -74,6 +105,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField(
         max_length=None, use_url=True,
     )
+    images = ImageRenditionsField(source='image')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -81,21 +113,63 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author',
                   'ingredients',
-                  'name', 'image',
+                  'name', 'image', 'images',
                   'text', 'cooking_time',
                   'is_favorited', 'is_in_shopping_cart'
                   )
+        list_serializer_class = CachedRecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes):
+        request = self.context.get('request')
+        host = request.build_absolute_uri('/') if request is not None else ''
+        keys, fragments = recipe_fragments.get_many(
+            [recipe.pk for recipe in recipes], host
+        )
+        missed = [recipe for recipe in recipes if recipe.pk not in fragments]
+        if missed:
+            prefetch_related_objects(missed, *RECIPE_PREFETCH)
+            new_fragments = {
+                recipe.pk: super(RecipeSerializer, self).to_representation(
+                    recipe
+                )
+                for recipe in missed
+            }
+            recipe_fragments.set_many({
+                keys[pk]: fragment for pk, fragment in new_fragments.items()
+            })
+            fragments.update(new_fragments)
+        return [
+            self.add_user_flags(fragments[recipe.pk], recipe)
+            for recipe in recipes
+        ]
+
+    def add_user_flags(self, fragment, recipe):
+        data = dict(fragment)
+        data['author'] = dict(fragment['author'])
+        data['author']['is_subscribed'] = (
+            self.fields['author'].get_is_subscribed(recipe.author)
+        )
+        data['is_favorited'] = self.get_is_favorited(recipe)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+        return data
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'favorited'):
+            return obj.favorited
         return Favorite.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'in_shopping_cart'):
+            return obj.in_shopping_cart
         return ShoppingCart.objects.filter(
             user=request.user, recipe=obj).exists()
 
@@ -108,7 +182,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = IngredientForCreatingRecipeSerializer(
         source='ingredient_in_recipe', many=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = CachedTagPrimaryKeyField(
         many=True, required=True, queryset=Tag.objects.all()
     )
     image = Base64ImageField(
@@ -131,15 +205,48 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Установленные в рецепте теги повторяются'
             )
-        if len(ingredients) > 1:
-            ingredient_id = ingredients[0]['ingredient_id']
-            for ingredient in ingredients[1:]:
-                if ingredient_id == ingredient['ingredient_id']:
-                    raise serializers.ValidationError(
-                        'Установленные в рецепте ингредиенты повторяются'
-                    )
+        self.validate_ingredient_ids(ingredients)
         return super().validate(attrs)
 
+    def validate_ingredient_ids(self, ingredients):
+        """
+        Находит все повторы ингредиентов за один проход,
+        существование всех ингредиентов проверяется одним запросом.
+        Ошибки возвращаются по каждому ингредиенту списка.
+        """
+        ingredient_ids = [
+            ingredient['ingredient_id'] for ingredient in ingredients
+        ]
+        existing_ids = set(
+            Ingredient.objects.filter(id__in=ingredient_ids).values_list(
+                'id', flat=True
+            )
+        )
+        seen_ids = set()
+        errors = []
+        for ingredient_id in ingredient_ids:
+            if ingredient_id not in existing_ids:
+                errors.append({'id': [
+                    f'Ингредиента с id {ingredient_id} не существует'
+                ]})
+            elif ingredient_id in seen_ids:
+                errors.append({'id': [
+                    'Установленные в рецепте ингредиенты повторяются'
+                ]})
+            else:
+                errors.append({})
+            seen_ids.add(ingredient_id)
+        if any(errors):
+            raise serializers.ValidationError({'ingredients': errors})
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
         recipe = super().to_representation(instance)
         recipe = RecipeSerializer(instance).data
@@ -164,17 +271,78 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
         recipe.tags.set(tags)
         self.create_ingredient_in_recipe(recipe, ingredients_data)
+        schedule_renditions(recipe.image.name)
         return recipe
 
+    def update_tags(self, recipe, tags):
+        old_tags = set(
+            Recipe.tags.through.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True
+            )
+        )
+        new_tags = set(tags)
+        if old_tags - new_tags:
+            recipe.tags.remove(*(old_tags - new_tags))
+        if new_tags - old_tags:
+            recipe.tags.add(*(new_tags - old_tags))
+
+    def update_ingredient_in_recipe(self, recipe, old_amounts, new_amounts):
+        """
+        Удаляет, добавляет и изменяет только те строки IngredientInRecipe,
+        которые отличаются от новых данных.
+        """
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        added = new_amounts.keys() - old_amounts.keys()
+        if added:
+            self.create_ingredient_in_recipe(
+                recipe,
+                [
+                    {'ingredient_id': ingredient_id,
+                     'amount': new_amounts[ingredient_id]}
+                    for ingredient_id in added
+                ]
+            )
+        changed = {
+            ingredient_id: amount
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id in old_amounts
+            and old_amounts[ingredient_id] != amount
+        }
+        if changed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=changed
+            ).update(amount=Case(
+                *[
+                    When(ingredient_id=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in changed.items()
+                ],
+                output_field=IntegerField(),
+            ))
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredient_in_recipe')
+        image_changed = 'image' in validated_data
+        if image_changed:
+            validated_data['renditions_ready'] = False
         instance = super(RecipeCreateSerializer, self).update(
             instance, validated_data
         )
-        instance.tags.set(tags)
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        self.create_ingredient_in_recipe(instance, ingredients_data)
+        if image_changed:
+            schedule_renditions(instance.image.name)
+        self.update_tags(instance, tags)
+        old_amounts = get_recipe_amounts(instance.id)
+        new_amounts = {
+            ingredient_data['ingredient_id']: ingredient_data['amount']
+            for ingredient_data in ingredients_data
+        }
+        self.update_ingredient_in_recipe(instance, old_amounts, new_amounts)
+        update_recipe_in_shopping_lists(instance.id, old_amounts, new_amounts)
         return instance
 
 
@@ -182,6 +350,7 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
     """
     Сериализатор модели Favorite. Позволяет добавить рецепт в Избранное.
     """
+    duplicate_message = 'Этот рецепт уже есть в Избранном'
     id = serializers.ReadOnlyField(source='recipe.id')
     name = serializers.ReadOnlyField(source='recipe.name')
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
@@ -196,23 +365,13 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
         extra_kwargs = {'recipe': {'write_only': True},
                         'user': {'write_only': True}}
 
-    def validate(self, attrs):
-        recipe = get_object_or_404(
-            Recipe, pk=self.context.get('pk')
-        )
-        user = self.context.get('user')
-        if Favorite.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError(
-                'Этот рецепт уже есть в Избранном'
-            )
-        return super().validate(attrs)
-
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
     """
     Сериализатор модели ShoppingCart.
     Позволяет добавить рецепт в Список покупок.
     """
+    duplicate_message = 'Этот рецепт уже есть в Списке покупок'
     id = serializers.ReadOnlyField(source='recipe.id')
     name = serializers.ReadOnlyField(source='recipe.name')
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
@@ -227,13 +386,11 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         extra_kwargs = {'recipe': {'write_only': True},
                         'user': {'write_only': True}}
 
-    def validate(self, attrs):
-        recipe = get_object_or_404(
-            Recipe, pk=self.context.get('pk')
-        )
-        user = self.context.get('user')
-        if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError(
-                'Этот рецепт уже есть в Избранном'
-            )
-        return super().validate(attrs)
+
+class ProfilingSettingsSerializer(serializers.Serializer):
+    """Настройки профилирования запросов"""
+    enabled = serializers.BooleanField(required=False)
+    slow_requests = serializers.IntegerField(
+        min_value=0, max_value=100, required=False
+    )
+    server_timing = serializers.BooleanField(required=False)
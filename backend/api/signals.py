@@ -0,0 +1,221 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.counters import RECIPE_COUNTER_FIELDS, change_counter
+from recipes.images import renditions_generated
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.shopping_list import (get_recipe_amounts,
+                                   update_recipe_in_shopping_lists)
+from users.authentication import token_user_cache
+from users.models import Subscription, User
+from .cache import (ingredient_catalog, recipe_fragments, recipe_responses,
+                    tag_catalog)
+from .db import check_connection_health, request_health_checks
+from .profiling import collect_query
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tag_catalog(sender, **kwargs):
+    """Сбрасывает кэш справочника тегов при его изменении"""
+    tag_catalog.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_catalog(sender, **kwargs):
+    """
+    Сбрасывает кэш справочника ингредиентов при его изменении,
+    вместе с ним перестраивается и индекс поиска ингредиентов.
+    """
+    ingredient_catalog.invalidate()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    """
+    Убирает ингредиенты удаляемого рецепта из сводных Списков покупок
+    пользователей, у которых рецепт был в Списке покупок.
+    """
+    if ShoppingCart.objects.filter(recipe=instance).exists():
+        update_recipe_in_shopping_lists(
+            instance.id, get_recipe_amounts(instance.id), {}
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrease_recipe_counters(sender, instance, **kwargs):
+    """
+    Счетчики рецепта уменьшаются при любом удалении связи,
+    в том числе каскадном при удалении пользователя.
+    Представления при удалении счетчики не меняют.
+    """
+    change_counter(
+        Recipe, instance.recipe_id, RECIPE_COUNTER_FIELDS[sender], -1
+    )
+
+
+@receiver(post_delete, sender=Subscription)
+def decrease_subscribers_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'subscribers_count', -1)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=IngredientInRecipe)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(renditions_generated)
+def invalidate_recipe_responses(sender, **kwargs):
+    """
+    Сбрасывает кэш ответов со списком рецептов и рецептами
+    после фиксации транзакции, в которой изменились данные.
+    """
+    transaction.on_commit(recipe_responses.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_recipe_fragments(sender, **kwargs):
+    """Сбрасывает фрагменты всех рецептов при изменении справочников"""
+    transaction.on_commit(recipe_fragments.invalidate)
+
+
+def invalidate_recipe_fragments_later(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(
+        lambda: recipe_fragments.invalidate_objects(recipe_ids)
+    )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe_fragment(sender, instance, **kwargs):
+    invalidate_recipe_fragments_later([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=IngredientInRecipe)
+def invalidate_recipe_fragment_on_ingredient_change(sender, instance,
+                                                    **kwargs):
+    invalidate_recipe_fragments_later([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_fragment_on_tags_change(sender, instance, action,
+                                              reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipe_fragments_later([instance.pk])
+    elif pk_set:
+        invalidate_recipe_fragments_later(pk_set)
+    else:
+        transaction.on_commit(recipe_fragments.invalidate)
+
+
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def check_author_fields_changed(sender, instance, update_fields, **kwargs):
+    """
+    Отмечает, изменились ли поля пользователя, которые выводятся
+    в блоке автора рецепта. Новые пользователи рецептов не имеют.
+    """
+    instance.author_fields_changed = False
+    if instance._state.adding or (
+        update_fields is not None
+        and not set(update_fields) & set(AUTHOR_FIELDS)
+    ):
+        return
+    saved = User.objects.filter(pk=instance.pk).values(*AUTHOR_FIELDS).first()
+    instance.author_fields_changed = saved is not None and any(
+        saved[field] != getattr(instance, field) for field in AUTHOR_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_recipe_fragments_on_author_change(sender, instance, created,
+                                                 **kwargs):
+    """
+    Сбрасывает фрагменты и ответы только с рецептами этого автора.
+    Удаление пользователя удаляет и его рецепты, кэш при этом
+    сбрасывают обработчики удаления рецептов.
+    """
+    if created or not getattr(instance, 'author_fields_changed', False):
+        return
+    recipe_ids = list(
+        Recipe.objects.filter(author=instance).values_list('pk', flat=True)
+    )
+    if recipe_ids:
+        invalidate_recipe_fragments_later(recipe_ids)
+        transaction.on_commit(recipe_responses.invalidate)
+
+
+@receiver(renditions_generated)
+def invalidate_recipe_fragment_on_renditions(sender, image_name, **kwargs):
+    invalidate_recipe_fragments_later(
+        Recipe.objects.filter(image=image_name).values_list('pk', flat=True)
+    )
+
+
+def invalidate_token_user_later(user_id):
+    """
+    Версия авторизации меняется сразу и еще раз после фиксации
+    транзакции, чтобы процессы, прочитавшие из БД старые данные
+    до фиксации, не закэшировали их под новой версией.
+    """
+    token_user_cache.invalidate_user(user_id)
+    transaction.on_commit(lambda: token_user_cache.invalidate_user(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """
+    Выход пользователя (удаление токена) сбрасывает кэш токена
+    во всех процессах.
+    """
+    token_user_cache.invalidate_token(instance.key)
+    invalidate_token_user_later(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_token_user(sender, instance, **kwargs):
+    """
+    Смена пароля, блокировка и любое другое сохранение пользователя
+    сбрасывают кэш его токенов.
+    """
+    invalidate_token_user_later(instance.pk)
+
+
+@receiver(connection_created)
+def install_execute_wrappers(sender, connection, **kwargs):
+    """
+    Запросы каждого соединения учитываются профилированием,
+    постоянные соединения проверяются перед первым запросом.
+    Только что открытое соединение в проверке не нуждается.
+    """
+    connection.health_check_needed = False
+    for wrapper in (check_connection_health, collect_query):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+
+@receiver(request_started)
+def check_db_connections(sender, **kwargs):
+    request_health_checks()
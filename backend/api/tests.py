@@ -0,0 +1,605 @@
+import base64
+import json
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import (TransactionTestCase, override_settings,
+                         skipUnlessDBFeature)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from api.cache import recipe_fragments, recipe_responses
+from recipes.images import mark_renditions_ready
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.authentication import TokenUserCache, token_user_cache
+from users.models import Subscription, User
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@foodgram.local',
+        password='password', first_name='Имя', last_name='Фамилия'
+    )
+
+
+def create_recipes(authors, count, tags, ingredients):
+    """Рецепты по очереди от authors, с тегами и ингредиентами"""
+    recipes = [
+        Recipe.objects.create(
+            author=authors[number % len(authors)], name=f'Рецепт {number}',
+            image='recipes/test.png', text='Описание', cooking_time=10
+        )
+        for number in range(count)
+    ]
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+        for recipe in recipes
+        for tag in tags
+    ])
+    IngredientInRecipe.objects.bulk_create([
+        IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+        for recipe in recipes
+        for ingredient in ingredients
+    ])
+    return recipes
+
+
+class RecipeAPITestCase(APITestCase):
+    """
+    Общие данные для тестов API рецептов. Перед каждым замеряемым
+    запросом кэши очищаются, чтобы число запросов к БД
+    не зависело от порядка запросов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.authors = [create_user(f'author{number}') for number in range(3)]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        cls.recipes = create_recipes(
+            cls.authors, 30, cls.tags, cls.ingredients
+        )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def clear_caches(self):
+        for cache in caches.all():
+            cache.clear()
+        token_user_cache.clear()
+
+    def count_queries(self, url):
+        self.clear_caches()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+class RecipeListQueryCountTests(RecipeAPITestCase):
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        """Признаки is_favorited/is_in_shopping_cart не добавляют запросов"""
+        self.client.post(f'/api/recipes/{self.recipes[0].id}/favorite/')
+        self.client.post(f'/api/recipes/{self.recipes[1].id}/shopping_cart/')
+        expected = self.count_queries('/api/recipes/?limit=1')
+        for limit in (5, 30):
+            self.clear_caches()
+            with self.assertNumQueries(expected):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(len(response.data['results']), limit)
+
+
+class RecipeCursorPaginationTests(RecipeAPITestCase):
+
+    def test_cursor_pages_follow_pub_date(self):
+        response = self.client.get('/api/recipes/?pagination=cursor&limit=20')
+        ids = [recipe['id'] for recipe in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids += [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(
+            ids,
+            list(Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            ))
+        )
+
+    def test_cursor_rejects_popular_ordering(self):
+        response = self.client.get(
+            '/api/recipes/?pagination=cursor&ordering=popular'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+
+
+class RecipeEndpointQueryBudgetTests(RecipeAPITestCase):
+    """
+    Число запросов к БД на эндпоинтах чтения не превышает бюджет.
+    Бюджеты считаются при пустых кэшах, с учетом запроса токена
+    и заполнения кэшей справочников, и не зависят от объема данных.
+    """
+    budgets = {
+        '/api/recipes/': 6,
+        '/api/recipes/?limit=30': 6,
+        '/api/recipes/?tags=tag0&tags=tag1': 7,
+        '/api/recipes/?author={author}': 6,
+        '/api/recipes/?is_favorited=1': 6,
+        '/api/recipes/?is_in_shopping_cart=1': 6,
+        '/api/recipes/?ordering=popular': 6,
+        '/api/recipes/?pagination=cursor': 5,
+        '/api/recipes/{recipe}/': 5,
+        '/api/recipes/download_shopping_cart/': 2,
+        '/api/users/subscriptions/?recipes_limit=3': 4,
+        '/api/tags/': 2,
+        '/api/ingredients/': 2,
+        '/api/ingredients/?name=ингр': 2,
+    }
+    anonymous_budgets = {
+        '/api/recipes/': 4,
+        '/api/recipes/?tags=tag0': 5,
+        '/api/recipes/{recipe}/': 3,
+        '/api/tags/': 1,
+        '/api/ingredients/': 1,
+    }
+
+    def setUp(self):
+        super().setUp()
+        for recipe in self.recipes[:5]:
+            self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        for author in self.authors:
+            self.client.post(f'/api/users/{author.id}/subscribe/')
+
+    def check_budgets(self, budgets):
+        for url, budget in budgets.items():
+            url = url.format(
+                author=self.authors[0].id, recipe=self.recipes[0].id
+            )
+            with self.subTest(url=url):
+                self.assertLessEqual(self.count_queries(url), budget)
+
+    def test_authenticated_query_budgets(self):
+        self.check_budgets(self.budgets)
+
+    def test_anonymous_query_budgets(self):
+        self.client.credentials()
+        self.check_budgets(self.anonymous_budgets)
+
+
+class RecipeFilterQueryShapeTests(RecipeAPITestCase):
+
+    def get_query_shapes(self, user, url):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.clear_caches()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [
+            re.sub(r"'[^']*'|\d+", '?', query['sql'])
+            for query in context.captured_queries
+        ]
+
+    def test_query_shape_does_not_depend_on_favorites_count(self):
+        """
+        Избранное и Список покупок не раскрываются в список id:
+        у пользователей с 5 и 30 рецептами в Избранном
+        страницы из 5 рецептов получаются одинаковыми запросами.
+        """
+        casual = create_user('casual')
+        power = create_user('power')
+        Favorite.objects.bulk_create([
+            Favorite(user=casual, recipe=recipe) for recipe in self.recipes[:5]
+        ])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=casual, recipe=recipe)
+            for recipe in self.recipes[:5]
+        ])
+        Favorite.objects.bulk_create([
+            Favorite(user=power, recipe=recipe) for recipe in self.recipes
+        ])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=power, recipe=recipe) for recipe in self.recipes
+        ])
+        for url in (
+            '/api/recipes/?is_favorited=1&limit=5',
+            '/api/recipes/?is_in_shopping_cart=1&limit=5',
+            '/api/recipes/?is_favorited=1&tags=tag0&limit=5',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.get_query_shapes(casual, url),
+                    self.get_query_shapes(power, url)
+                )
+
+
+class CounterTests(RecipeAPITestCase):
+    """Счетчики меняются ровно на одну связь при любом удалении"""
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [recipe.id for recipe in self.recipes[:3]]
+        for name in ('favorite', 'shopping_cart'):
+            self.client.post(
+                f'/api/recipes/{name}/batch/', {'ids': self.ids},
+                format='json'
+            )
+        self.client.post(
+            '/api/users/subscribe/batch/',
+            {'ids': [author.id for author in self.authors]}, format='json'
+        )
+
+    def assert_counters(self):
+        for recipe in Recipe.objects.filter(id__in=self.ids):
+            self.assertEqual(
+                recipe.favorites_count,
+                Favorite.objects.filter(recipe=recipe).count()
+            )
+            self.assertEqual(
+                recipe.in_carts_count,
+                ShoppingCart.objects.filter(recipe=recipe).count()
+            )
+        author_ids = [author.id for author in self.authors]
+        for author in User.objects.filter(id__in=author_ids):
+            self.assertEqual(
+                author.subscribers_count,
+                Subscription.objects.filter(author=author).count()
+            )
+
+    def test_delete_through_api(self):
+        self.assert_counters()
+        self.client.delete(f'/api/recipes/{self.ids[0]}/favorite/')
+        self.client.delete(
+            '/api/recipes/shopping_cart/batch/', {'ids': self.ids[:2]},
+            format='json'
+        )
+        self.client.delete(f'/api/users/{self.authors[0].id}/subscribe/')
+        self.client.delete(
+            '/api/users/subscribe/batch/', {'ids': [self.authors[1].id]},
+            format='json'
+        )
+        self.assert_counters()
+        self.assertEqual(
+            Recipe.objects.get(id=self.ids[0]).favorites_count, 0
+        )
+
+    def test_cascade_delete(self):
+        self.user.delete()
+        self.assert_counters()
+        self.assertFalse(Recipe.objects.filter(
+            id__in=self.ids, favorites_count__gt=0
+        ).exists())
+
+
+class RebuildShoppingListsTests(RecipeAPITestCase):
+    """
+    Порядок имен пользователей и ингредиентов отличается от порядка id,
+    один рецепт лежит в Списках покупок нескольких пользователей.
+    """
+
+    def setUp(self):
+        super().setUp()
+        ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('яблоко', 'абрикос')
+        ]
+        recipe = create_recipes([self.authors[0]], 1, [], ingredients)[0]
+        IngredientInRecipe.objects.filter(
+            recipe=recipe, ingredient=ingredients[1]
+        ).update(amount=3)
+        self.users = [self.user, *self.authors[1:]]
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=user, recipe=recipe) for user in self.users
+        ])
+        self.expected = {ingredients[0].id: 5, ingredients[1].id: 3}
+
+    def rebuild(self, *args):
+        call_command('rebuild_shopping_lists', *args, stdout=StringIO())
+
+    def get_totals(self, user):
+        return dict(ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient_id', 'total'
+        ))
+
+    def test_rebuild_all_and_one_user(self):
+        self.rebuild()
+        for user in self.users:
+            self.assertEqual(self.get_totals(user), self.expected)
+        self.rebuild('--user', str(self.user.id))
+        for user in self.users:
+            self.assertEqual(self.get_totals(user), self.expected)
+
+    def test_check_all_and_one_user(self):
+        self.rebuild()
+        self.rebuild('--check')
+        self.rebuild('--check', '--user', str(self.user.id))
+        ShoppingListItem.objects.filter(user=self.user).update(total=1)
+        with self.assertRaises(CommandError):
+            self.rebuild('--check', '--user', str(self.user.id))
+        with self.assertRaises(CommandError):
+            self.rebuild('--check')
+        self.rebuild('--check', '--user', str(self.authors[1].id))
+
+
+class ImportRecipesTests(RecipeAPITestCase):
+
+    def get_state(self, recipe_id):
+        recipe = Recipe.objects.get(pk=recipe_id)
+        return (
+            recipe.pub_date,
+            set(recipe.tags.values_list('id', flat=True)),
+            set(IngredientInRecipe.objects.filter(
+                recipe=recipe
+            ).values_list('ingredient_id', 'amount')),
+        )
+
+    def test_existing_recipes_are_not_changed(self):
+        existing = self.recipes[0]
+        before = self.get_state(existing.id)
+        new_id = Recipe.objects.order_by('-id').first().id + 1
+        records = [
+            {
+                'id': recipe_id, 'author': self.authors[1].id,
+                'name': 'Загруженный', 'image': 'recipes/test.png',
+                'text': 'Описание', 'cooking_time': 5,
+                'pub_date': '2020-01-01T00:00:00+00:00',
+                'tags': [self.tags[1].id],
+                'ingredients': [{'id': self.ingredients[2].id, 'amount': 7}],
+            }
+            for recipe_id in (existing.id, new_id)
+        ]
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.jsonl', encoding='utf-8'
+        ) as file:
+            file.write('\n'.join(json.dumps(record) for record in records))
+            file.flush()
+            call_command('import_recipes', 'recipes', file.name,
+                         stdout=StringIO())
+        self.assertEqual(self.get_state(existing.id), before)
+        pub_date, tags, ingredients = self.get_state(new_id)
+        self.assertEqual(pub_date.year, 2020)
+        self.assertEqual(tags, {self.tags[1].id})
+        self.assertEqual(ingredients, {(self.ingredients[2].id, 7)})
+
+
+class AuthorChangeInvalidationTests(RecipeAPITestCase):
+
+    def get_fragment_versions(self):
+        return recipe_fragments.get_object_versions(
+            [recipe.id for recipe in self.recipes]
+        )
+
+    def test_only_author_recipes_are_invalidated(self):
+        self.clear_caches()
+        versions = self.get_fragment_versions()
+        author = self.authors[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            author.first_name = 'Другое имя'
+            author.save()
+        changed = {
+            pk for pk, version in self.get_fragment_versions().items()
+            if version != versions[pk]
+        }
+        self.assertEqual(changed, {
+            recipe.id for recipe in self.recipes
+            if recipe.author_id == author.id
+        })
+
+    def test_other_user_changes_keep_fragments(self):
+        self.clear_caches()
+        fragments_version = recipe_fragments.get_version()
+        responses_version = recipe_responses.get_version()
+        versions = self.get_fragment_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_user('new_user')
+            self.authors[0].set_password('new_password')
+            self.authors[0].save()
+            self.authors[1].save(update_fields=['last_login'])
+        self.assertEqual(recipe_fragments.get_version(), fragments_version)
+        self.assertEqual(recipe_responses.get_version(), responses_version)
+        self.assertEqual(self.get_fragment_versions(), versions)
+
+
+class TokenUserCacheTests(RecipeAPITestCase):
+
+    def test_invalidation_is_shared_between_processes(self):
+        """Кэши двух процессов с общим кэшем версий авторизации"""
+        self.clear_caches()
+        first, second = TokenUserCache(10, 60), TokenUserCache(10, 60)
+        first.set(self.token.key, self.user, self.token)
+        self.assertIsNotNone(first.get(self.token.key))
+        second.invalidate_user(self.user.id)
+        self.assertIsNone(first.get(self.token.key))
+
+    def test_logout_resets_cached_user(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.client.post('/api/auth/token/logout/')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+class RecipeImageTests(RecipeAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def get_image_data(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Камера'
+        exif[0x8825] = {1: 'N', 2: (55.0, 45.0, 0.0)}
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(
+            buffer, format='JPEG', exif=exif.tobytes()
+        )
+        return 'data:image/jpeg;base64,' + base64.b64encode(
+            buffer.getvalue()
+        ).decode()
+
+    def test_uploaded_image_has_no_metadata(self):
+        response = self.client.post('/api/recipes/', {
+            'name': 'Рецепт с фото', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 10}],
+            'image': self.get_image_data(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        with recipe.image.open('rb') as image_file:
+            self.assertEqual(dict(Image.open(image_file).getexif()), {})
+        self.assertEqual(
+            set(response.data['images'].values()), {response.data['image']}
+        )
+
+        mark_renditions_ready(recipe.image.name)
+        self.clear_caches()
+        images = self.client.get(f'/api/recipes/{recipe.id}/').data['images']
+        self.assertIn('/recipes/renditions/', images['thumbnail'])
+
+
+class ConcurrentAddDeleteTests(TransactionTestCase):
+    """
+    Одновременные добавления и удаления из потоков
+    не ломают счетчики и сводный Список покупок.
+    Потокам нужна общая БД: для SQLite задайте файл DB_TEST_NAME.
+    """
+    threads = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Потокам нужна БД SQLite в файле (DB_TEST_NAME)')
+        self.user = create_user('user')
+        self.token = Token.objects.create(user=self.user)
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        self.recipes = create_recipes([self.user], 4, [], ingredients)
+        token_user_cache.clear()
+
+    def run_concurrently(self, requests):
+        """
+        Выполняет запросы (метод, адрес, данные) одновременно,
+        каждый в своем потоке, и возвращает коды ответов.
+        """
+        barrier = threading.Barrier(len(requests))
+
+        def request(method, url, data):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            try:
+                barrier.wait()
+                return getattr(client, method)(
+                    url, data, format='json'
+                ).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+            return list(executor.map(lambda args: request(*args), requests))
+
+    def assert_consistent(self):
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                recipe.favorites_count,
+                Favorite.objects.filter(recipe=recipe).count()
+            )
+            self.assertEqual(
+                recipe.in_carts_count,
+                ShoppingCart.objects.filter(recipe=recipe).count()
+            )
+        expected = dict(
+            IngredientInRecipe.objects.filter(
+                recipe__is_in_shopping_cart__user=self.user
+            ).values('ingredient_id').annotate(
+                total=Sum('amount')
+            ).order_by().values_list('ingredient_id', 'total')
+        )
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=self.user).values_list(
+                'ingredient_id', 'total'
+            )),
+            expected
+        )
+
+    def test_concurrent_add(self):
+        url = f'/api/recipes/{self.recipes[0].id}/favorite/'
+        statuses = self.run_concurrently([('post', url, None)] * self.threads)
+        self.assertEqual(sorted(statuses), [201] + [400] * (self.threads - 1))
+        self.assert_consistent()
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_delete(self):
+        """
+        Удаление с обработчиками post_delete сначала читает строки,
+        а SQLite не может повысить блокировку чтения до записи
+        при параллельной записи, поэтому тест только для СУБД
+        с блокировкой строк. Рецепт лежит и в Списке покупок другого
+        пользователя, чтобы двойное уменьшение счетчика не скрыл
+        его нижний предел 0.
+        """
+        url = f'/api/recipes/{self.recipes[0].id}/shopping_cart/'
+        ShoppingCart.objects.create(
+            user=create_user('other'), recipe=self.recipes[0]
+        )
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(in_carts_count=1)
+        self.run_concurrently([('post', url, None)])
+        statuses = self.run_concurrently(
+            [('delete', url, None)] * self.threads
+        )
+        self.assertEqual(sorted(statuses), [204] + [400] * (self.threads - 1))
+        self.assert_consistent()
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_single_and_batch_add(self):
+        """
+        Одиночные и пакетные запросы на одни и те же рецепты.
+        SQLite блокирует всю БД, поэтому тест только для СУБД
+        с блокировкой строк.
+        """
+        ids = [recipe.id for recipe in self.recipes]
+        requests = [
+            ('post', f'/api/recipes/{pk}/shopping_cart/', None) for pk in ids
+        ] + [('post', '/api/recipes/shopping_cart/batch/', {'ids': ids})] * 4
+        self.run_concurrently(requests)
+        self.assertEqual(
+            ShoppingCart.objects.filter(user=self.user).count(), len(ids)
+        )
+        self.assert_consistent()
+        requests = [
+            ('delete', f'/api/recipes/{pk}/shopping_cart/', None)
+            for pk in ids
+        ] + [('delete', '/api/recipes/shopping_cart/batch/', {'ids': ids})] * 4
+        self.run_concurrently(requests)
+        self.assertFalse(ShoppingCart.objects.filter(user=self.user).exists())
+        self.assert_consistent()
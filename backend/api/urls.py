@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+from .views import (IngredientViewSet, MetricsView, ProfilingSettingsView,
+                    RecipeViewSet, TagViewSet)
 
 app_name = 'api'
 
@@ -11,5 +12,10 @@ router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path(
+        'metrics/profiling/', ProfilingSettingsView.as_view(),
+        name='profiling'
+    ),
     path('', include(router.urls))
 ]
@@ -1,38 +1,57 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import json
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import HttpResponse, QueryDict, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from users.models import Subscription, User
+from .cache import ingredient_catalog, recipe_responses, tag_catalog
+from .exporters import SHOPPING_CART_EXPORTERS
 from .filters import IngredientFilter, RecipeFilter
-from .mixins import AddDelRecipeViewMixin, ListCreateDestroyMixin
-from .paginator import RecipeResultsSetPagination
-from .permissions import IsAdminOrReadOnly
+from .mixins import (AddDelRecipeViewMixin, AnonymousResponseCacheMixin,
+                     CatalogListMixin, ListCreateDestroyMixin)
+from .paginator import RecipeCursorPagination, RecipeResultsSetPagination
+from .parsers import LimitedJSONParser, LimitedMultiPartParser
+from .permissions import IsAdmin, IsAdminOrReadOnly, IsMetricsClient
+from .profiling import (get_profiling_settings, metrics_registry,
+                        set_profiling_settings, slow_request_log)
+from .search import ingredient_search_index
 from .serializers import (FavoriteRecipeSerializer, IngredientSerializer,
-                          RecipeCreateSerializer, RecipeSerializer,
-                          ShoppingCartSerializer, TagSerializer)
+                          ProfilingSettingsSerializer, RecipeCreateSerializer,
+                          RecipeSerializer, ShoppingCartSerializer,
+                          TagSerializer)
 
 
-class TagViewSet(ListCreateDestroyMixin):
+class TagViewSet(CatalogListMixin, ListCreateDestroyMixin):
     """
     Вьюсет для urls 'tags'.
     Обеспечивает получение списка тегов/одного тега.
+    Список тегов выдается из кэша справочника.
     """
+    catalog = tag_catalog
     permission_classes = [IsAdminOrReadOnly]
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CatalogListMixin, viewsets.ModelViewSet):
     """
     Вьюсет для urls 'ingredients'.
     Обеспечивает получение списка ингредиентов/одного ингредиента.
     Позволяет осуществить поиск ингредиента по названию.
+    Полный список ингредиентов выдается из кэша справочника.
     """
+    catalog = ingredient_catalog
     permission_classes = [IsAdminOrReadOnly]
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
@@ -40,26 +59,116 @@ class IngredientViewSet(viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        """
+        При поиске по названию выдача ограничена
+        INGREDIENT_SEARCH_LIMIT записями и по умолчанию берется
+        из индекса в памяти процесса, без запроса к БД.
+        """
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        if settings.INGREDIENT_SEARCH_IN_MEMORY:
+            return Response(ingredient_search_index.search(name, limit))
+        queryset = self.filter_queryset(self.get_queryset())[:limit]
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
 
-class RecipeViewSet(viewsets.ModelViewSet, AddDelRecipeViewMixin):
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet,
+                    AddDelRecipeViewMixin):
     """
     Вьюсет для urls 'recipes'.
     Позволяет получить список рецептов/рецепт, создать,
     отредактировать рецепт; добавить рецепт в Избранное
     и/или Список покупок; выгрузить Список покупок.
     Настроена фильтрация по тегу и автору рецепта.
+    Ответы анонимным пользователям кэшируются.
     """
-    queryset = Recipe.objects.all()
+    response_cache = recipe_responses
+    cache_query_params = (
+        'tags', 'author', 'ordering', 'page', 'limit', 'pagination', 'cursor'
+    )
     permission_classes = [AllowAny]
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = RecipeResultsSetPagination
+    parser_classes = (LimitedJSONParser, LimitedMultiPartParser)
+
+    def get_queryset(self):
+        """
+        Для списка и одного рецепта автор подгружается заранее,
+        а признаки is_favorited/is_in_shopping_cart и is_subscribed
+        автора вычисляются подзапросами EXISTS, поэтому число запросов
+        не зависит от размера страницы. Теги и ингредиенты подгружает
+        RecipeSerializer для рецептов, которых нет в кэше фрагментов.
+        """
+        queryset = Recipe.objects.all()
+        if self.action not in ['list', 'retrieve']:
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.select_related('author')
+        return queryset.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(
+                    subscribed=Exists(Subscription.objects.filter(
+                        user=user, author=OuterRef('pk')
+                    ))
+                )
+            ),
+        ).annotate(
+            favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        data = kwargs.get('data')
+        if isinstance(data, QueryDict):
+            kwargs['data'] = self.get_multipart_data(data)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_multipart_data(self, data):
+        """
+        Приводит данные multipart/form-data к виду JSON-запроса:
+        теги передаются повторяющимся полем tags,
+        ингредиенты - JSON-строкой в поле ingredients,
+        изображение - файлом в поле image.
+        """
+        multipart_data = data.dict()
+        if 'tags' in data:
+            multipart_data['tags'] = data.getlist('tags')
+        if 'ingredients' in data:
+            try:
+                multipart_data['ingredients'] = json.loads(
+                    data['ingredients']
+                )
+            except ValueError:
+                raise ValidationError(
+                    {'ingredients': ['Ожидается JSON-список ингредиентов']}
+                )
+        return multipart_data
+
     @action(methods=['POST', 'DELETE'],
             detail=True,
             permission_classes=(IsAuthenticated,),
@@ -90,6 +199,28 @@ class RecipeViewSet(viewsets.ModelViewSet, AddDelRecipeViewMixin):
             pk, serializer, queryset
         )
 
+    @action(methods=['POST', 'DELETE'],
+            detail=False,
+            permission_classes=(IsAuthenticated,),
+            url_path='favorite/batch')
+    def favorite_batch(self, request):
+        """
+        Метод для добавления в Избранное и удаления из Избранного
+        нескольких рецептов одним запросом.
+        """
+        return self.add_del_batch(Favorite)
+
+    @action(methods=['POST', 'DELETE'],
+            detail=False,
+            permission_classes=(IsAuthenticated,),
+            url_path='shopping_cart/batch')
+    def shopping_cart_batch(self, request):
+        """
+        Метод для добавления в Список покупок и удаления из Списка покупок
+        нескольких рецептов одним запросом.
+        """
+        return self.add_del_batch(ShoppingCart)
+
     @action(methods=['GET'],
             detail=False,
             permission_classes=(IsAuthenticated,),
@@ -97,20 +228,80 @@ class RecipeViewSet(viewsets.ModelViewSet, AddDelRecipeViewMixin):
     def download_shopping_cart(self, request):
         """
         Метод для вывода ингредиентов из Списка покупок.
-        Количество ингредиентов суммируется.
-        Данные выводятся в файле с расширением .txt
-        """
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__is_in_shopping_cart__user=self.request.user).values(
-            'ingredient__name',
-            'ingredient__measurement_unit').annotate(total=Sum('amount'))
-
-        shopping_cart = '\n'.join([
-            f'{ingredient["ingredient__name"]} - {ingredient["total"]}'
-            f'{ingredient["ingredient__measurement_unit"]}'
-            for ingredient in ingredients
-        ])
-        filename = 'shopping_cart.txt'
-        response = HttpResponse(shopping_cart, content_type='text/plain')
+        Суммарное количество ингредиентов берется из сводного
+        Списка покупок пользователя, ингредиенты
+        группируются по единице измерения.
+        Формат файла задается параметром export_format (txt или csv),
+        файл отдается потоком по мере чтения строк из БД.
+        """
+        export_format = request.query_params.get('export_format', 'txt')
+        exporter_class = SHOPPING_CART_EXPORTERS.get(export_format)
+        if exporter_class is None:
+            return Response(
+                {'export_format': [
+                    'Доступные форматы: '
+                    + ', '.join(SHOPPING_CART_EXPORTERS)
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        rows = ShoppingListItem.objects.filter(
+            user=self.request.user, total__gt=0
+        ).order_by(
+            'ingredient__measurement_unit', 'ingredient__name'
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'total'
+        ).iterator(chunk_size=settings.SHOPPING_CART_EXPORT_CHUNK_SIZE)
+
+        exporter = exporter_class()
+        filename = f'shopping_cart.{exporter.extension}'
+        response = StreamingHttpResponse(
+            exporter.render(rows), content_type=exporter.content_type
+        )
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
+
+
+class MetricsView(APIView):
+    """
+    Вьюкласс для метрик процесса в текстовом формате Prometheus.
+    """
+    permission_classes = (IsMetricsClient,)
+
+    def get(self, request):
+        stats = recipe_responses.get_stats()
+        body = metrics_registry.render(extra_metrics=[
+            (
+                'foodgram_response_cache_requests_total', 'counter',
+                'Обращения к кэшу ответов.',
+                [
+                    ({'cache': recipe_responses.name, 'result': result},
+                     stats[result])
+                    for result in ('hits', 'misses')
+                ]
+            ),
+        ])
+        return HttpResponse(
+            body, content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+
+class ProfilingSettingsView(APIView):
+    """
+    Вьюкласс для просмотра и изменения настроек профилирования
+    без перезапуска. GET также возвращает самые медленные запросы.
+    """
+    permission_classes = (IsAdmin,)
+
+    def get(self, request):
+        return Response({
+            **get_profiling_settings(),
+            'slowest': slow_request_log.get_entries(),
+        })
+
+    def patch(self, request):
+        serializer = ProfilingSettingsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        set_profiling_settings(**serializer.validated_data)
+        if serializer.validated_data.get('slow_requests') == 0:
+            slow_request_log.reset()
+        return Response(get_profiling_settings())
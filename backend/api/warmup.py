@@ -0,0 +1,45 @@
+import logging
+
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+from .cache import ingredient_catalog, tag_catalog
+from .search import ingredient_search_index
+
+logger = logging.getLogger(__name__)
+
+
+def import_views():
+    """
+    Импорт всех представлений и сериализаторов через URLconf.
+    Кэши при этом не заполняются, поэтому импорт можно выполнить
+    в мастер-процессе до запуска воркеров (preload_app).
+    """
+    get_resolver().url_patterns
+    connections.close_all()
+
+
+def fill_caches():
+    """
+    Заполнение кэшей справочников и индекса поиска ингредиентов.
+    Выполняется в каждом воркере: при кэше в памяти процесса
+    данные, заполненные в мастер-процессе, воркеры, перезапущенные
+    по max_requests, унаследовали бы в состоянии на момент запуска.
+    Соединения с БД после заполнения закрываются.
+    """
+    try:
+        tag_catalog.get()
+        ingredient_catalog.get()
+        if settings.INGREDIENT_SEARCH_IN_MEMORY:
+            ingredient_search_index.get_snapshot()
+    except Exception:
+        logger.exception('Не удалось заполнить кэши при прогреве')
+    finally:
+        connections.close_all()
+
+
+def warm_up():
+    """Прогрев приложения до приема запросов"""
+    import_views()
+    fill_caches()
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,10 +63,49 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
+        # Проверка постоянного соединения перед запросом, в Django 3.2
+        # выполняется api.db.request_health_checks
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('CONN_HEALTH_CHECKS', 'True') == 'True'
+        ),
+        # Тесты с потоками требуют БД в файле, а не в памяти
+        'TEST': {'NAME': os.getenv('DB_TEST_NAME')},
     }
 }
 
+# Кэши справочников, ответов, отзыва токенов и настроек профилирования
+# должны быть общими для всех процессов приложения. LocMemCache
+# по умолчанию подходит только для одного процесса, при нескольких
+# воркерах укажите общий бэкенд, например
+# django.core.cache.backends.memcached.PyMemcacheCache
+# или django.core.cache.backends.db.DatabaseCache.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION', default='foodgram-responses'
+        ),
+    },
+}
+
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 60 * 60 * 24))
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60))
+
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 60 * 5))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -106,7 +146,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -130,4 +170,69 @@ DJOSER = {
     },
 }
 
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 20))
+
+INGREDIENT_SEARCH_IN_MEMORY = (
+    os.getenv('INGREDIENT_SEARCH_IN_MEMORY', 'True') == 'True'
+)
+
+IMAGE_RENDITIONS = {
+    'thumbnail': 240,
+    'card': 640,
+    'full': 1600,
+}
+
+IMAGE_RENDITION_FORMAT = os.getenv('IMAGE_RENDITION_FORMAT', 'webp')
+
+IMAGE_RENDITION_QUALITY = 80
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+
+RECIPE_REQUEST_MAX_SIZE = int(
+    os.getenv('RECIPE_REQUEST_MAX_SIZE', 15 * 1024 * 1024)
+)
+
+BASE64_DECODE_CHUNK_SIZE = 64 * 1024
+
+SHOPPING_CART_EXPORT_CHUNK_SIZE = 2000
+
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 100))
+
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 10))
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+
+# Сброс кэша токенов виден другим процессам через версию
+# авторизации пользователя в общем кэше default.
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 60))
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True') == 'True'
+
+PROFILING_SLOW_REQUESTS = int(os.getenv('PROFILING_SLOW_REQUESTS', 0))
+
+# Заголовок Server-Timing с временем SQL раскрывает детали работы
+# приложения, поэтому по умолчанию не отправляется
+PROFILING_SERVER_TIMING = (
+    os.getenv('PROFILING_SERVER_TIMING', 'False') == 'True'
+)
+
+PROFILING_DEFAULT_BUDGET = {'queries': 20, 'duration': 1.0}
+
+# Бюджеты по представлению и методу, HEAD проверяется как GET
+PROFILING_BUDGETS = {
+    ('api:recipes-list', 'GET'): {'queries': 8, 'duration': 0.3},
+    ('api:recipes-detail', 'GET'): {'queries': 8, 'duration': 0.2},
+    ('api:ingredients-list', 'GET'): {'queries': 3, 'duration': 0.1},
+    ('api:tags-list', 'GET'): {'queries': 3, 'duration': 0.1},
+    ('users:subscriptions-list', 'GET'): {'queries': 6, 'duration': 0.3},
+}
+
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import sys
+
+# Профиль запуска задается переменными окружения:
+# GUNICORN_WORKER_CLASS - sync (по умолчанию), gthread или uvicorn (ASGI);
+# GUNICORN_WORKERS - число воркеров. Кэши справочников, ответов,
+# токенов и настройки профилирования должны быть общими для воркеров,
+# поэтому при кэше в памяти процесса (LocMemCache, по умолчанию)
+# воркер один, а больше одного воркера с таким кэшем не запускается.
+# С общим кэшем (CACHE_BACKEND и RESPONSE_CACHE_BACKEND, например
+# memcached или DatabaseCache) по умолчанию 2 * ядер + 1 воркеров,
+# для uvicorn - по числу ядер;
+# GUNICORN_THREADS - число потоков воркера gthread;
+# GUNICORN_PRELOAD - загрузка приложения до запуска воркеров,
+# кэши заполняются в каждом воркере после запуска.
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'uvicorn': 'uvicorn.workers.UvicornWorker',
+}
+
+worker_type = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+worker_class = WORKER_CLASSES[worker_type]
+wsgi_app = (
+    'foodgram.asgi:application' if worker_type == 'uvicorn'
+    else 'foodgram.wsgi:application'
+)
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+shared_cache = all(
+    os.getenv(name, PROCESS_LOCAL_CACHES[0]) not in PROCESS_LOCAL_CACHES
+    for name in ('CACHE_BACKEND', 'RESPONSE_CACHE_BACKEND')
+)
+
+cores = multiprocessing.cpu_count()
+if not shared_cache:
+    default_workers = 1
+elif worker_type == 'uvicorn':
+    default_workers = cores
+else:
+    default_workers = cores * 2 + 1
+workers = int(os.getenv('GUNICORN_WORKERS', default_workers))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+
+
+def on_starting(server):
+    """Не запускает несколько воркеров с кэшем в памяти процесса"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    from django.conf import settings
+    local_caches = [
+        alias for alias, cache in settings.CACHES.items()
+        if cache['BACKEND'] in PROCESS_LOCAL_CACHES
+    ]
+    if server.cfg.workers > 1 and local_caches:
+        server.log.error(
+            'Воркеров %s, но кэши %s хранятся в памяти процесса: '
+            'изменения справочников, выход пользователей и настройки '
+            'профилирования не будут видны другим воркерам. '
+            'Настройте общий кэш или запустите один воркер.',
+            server.cfg.workers, ', '.join(local_caches)
+        )
+        sys.exit(1)
+
+
+def when_ready(server):
+    """
+    Приложение уже загружено в мастер-процессе: импортируем
+    представления, а кэши заполняет каждый воркер сам
+    """
+    if preload_app:
+        from api.warmup import import_views
+        import_views()
+
+
+def post_worker_init(worker):
+    """Каждый воркер, в том числе перезапущенный, прогревается сам"""
+    from api.warmup import warm_up
+    warm_up()
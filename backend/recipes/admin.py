@@ -32,7 +32,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author', 'name', 'tags')
 
     def is_favorited_count(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
     is_favorited_count.short_description = u'в избранном'
 
 
@@ -0,0 +1,55 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Subscription, User
+from .models import Favorite, Recipe, ShoppingCart
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'author'),
+)
+RECIPE_COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def change_counters(model, pks, field, delta):
+    """Атомарно изменяет счетчик field объектов model на delta"""
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, [pk], field, delta)
+
+
+def get_count_expression(related_model, related_field):
+    """Подзапрос, считающий связанные объекты related_model"""
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+
+
+def count_counter_mismatches(model, field, related_model, related_field):
+    return model.objects.annotate(
+        actual_count=get_count_expression(related_model, related_field)
+    ).exclude(**{field: F('actual_count')}).count()
+
+
+def reconcile_counter(model, field, related_model, related_field):
+    """Пересчитывает счетчик field у всех объектов model"""
+    return model.objects.update(
+        **{field: get_count_expression(related_model, related_field)}
+    )
@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/renditions'
+EXIF_ORIENTATION = 0x0112
+KEPT_IMAGE_INFO = ('icc_profile', 'transparency', 'duration', 'loop', 'dpi')
+
+renditions_generated = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_rendition_name(image_name, rendition):
+    """Путь уменьшенной копии изображения в хранилище"""
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    extension = settings.IMAGE_RENDITION_FORMAT.lower()
+    return f'{RENDITIONS_DIR}/{stem}_{rendition}.{extension}'
+
+
+def get_rendition_url(image, rendition):
+    """
+    URL уменьшенной копии изображения рецепта.
+    Пока копии не готовы (renditions_ready), возвращается
+    URL исходного изображения. Хранилище не опрашивается.
+    """
+    if getattr(image.instance, 'renditions_ready', False):
+        return default_storage.url(get_rendition_name(image.name, rendition))
+    return image.url
+
+
+def strip_image_metadata(image_file):
+    """
+    Пересохраняет загруженное изображение без метаданных
+    (EXIF с координатами съемки, XMP, комментарии).
+    Ориентация из EXIF применяется к самому изображению,
+    ICC-профиль сохраняется. Возвращает новый временный файл.
+    """
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        image_format = image.format
+        options = {}
+        if getattr(image, 'is_animated', False):
+            options['save_all'] = True
+        elif image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+        elif image_format == 'JPEG':
+            options.update(quality='keep', subsampling='keep')
+        image.info = {
+            key: value for key, value in image.info.items()
+            if key in KEPT_IMAGE_INFO
+        }
+        stripped_file = TemporaryUploadedFile(
+            image_file.name, getattr(image_file, 'content_type', None),
+            None, None
+        )
+        image.save(stripped_file, format=image_format, **options)
+    stripped_file.size = stripped_file.tell()
+    stripped_file.seek(0)
+    return stripped_file
+
+
+def generate_renditions(image_name):
+    """
+    Создает уменьшенные копии изображения для всех размеров
+    из IMAGE_RENDITIONS. Копии сохраняются без метаданных (EXIF и пр.),
+    ориентация из EXIF применяется к самому изображению.
+    """
+    with default_storage.open(image_name, 'rb') as image_file:
+        image = Image.open(image_file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    image_format = settings.IMAGE_RENDITION_FORMAT.upper()
+    if image_format == 'JPEG':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    for rendition, size in settings.IMAGE_RENDITIONS.items():
+        rendition_image = image.copy()
+        rendition_image.thumbnail((size, size), Image.LANCZOS)
+        buffer = BytesIO()
+        rendition_image.save(
+            buffer, format=image_format,
+            quality=settings.IMAGE_RENDITION_QUALITY
+        )
+        rendition_name = get_rendition_name(image_name, rendition)
+        if default_storage.exists(rendition_name):
+            default_storage.delete(rendition_name)
+        default_storage.save(rendition_name, ContentFile(buffer.getvalue()))
+
+
+def mark_renditions_ready(image_name):
+    Recipe.objects.filter(image=image_name).update(renditions_ready=True)
+
+
+def _generate_renditions_safely(image_name):
+    """
+    Задача фонового потока. Соединения с БД потока закрываются
+    по тем же правилам, что и после запроса.
+    """
+    close_old_connections()
+    try:
+        generate_renditions(image_name)
+        mark_renditions_ready(image_name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', image_name)
+    else:
+        renditions_generated.send(sender=None, image_name=image_name)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS,
+                    thread_name_prefix='image-renditions'
+                )
+    return _executor
+
+
+def schedule_renditions(image_name):
+    """
+    Ставит создание уменьшенных копий в очередь фонового пула потоков
+    после фиксации транзакции, не задерживая ответ на запрос.
+    """
+    transaction.on_commit(
+        lambda: get_executor().submit(_generate_renditions_safely, image_name)
+    )
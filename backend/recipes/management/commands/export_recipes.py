@@ -0,0 +1,57 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import FORMATS, TRANSFERS, get_format, write_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает пользователей, ингредиенты, теги или рецепты '
+        'в JSON Lines или CSV, читая БД пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=TRANSFERS)
+        parser.add_argument(
+            '-o', '--output', default='-',
+            help='Путь к файлу, по умолчанию стандартный вывод.'
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки при чтении из БД.'
+        )
+
+    def handle(self, *args, **options):
+        transfer = TRANSFERS[options['entity']]
+        path = options['output']
+        format_name = get_format(path, options['format'])
+        stream = (
+            sys.stdout if path == '-'
+            else open(path, 'w', encoding='utf-8', newline='')
+        )
+        written = 0
+        started = time.monotonic()
+        try:
+            for written in write_records(
+                stream, format_name, transfer,
+                transfer.iter_batches(options['batch_size'])
+            ):
+                if options['verbosity'] > 1:
+                    self.report(options['entity'], written, started)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        self.report(options['entity'], written, started)
+
+    def report(self, entity, written, started):
+        elapsed = time.monotonic() - started
+        self.stderr.write(
+            f'{entity}: выгружено {written} записей за {elapsed:.1f} с '
+            f'({written / max(elapsed, 1e-6):.0f} записей/с)'
+        )
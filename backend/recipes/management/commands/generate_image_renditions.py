@@ -0,0 +1,48 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.images import (generate_renditions, get_rendition_name,
+                            mark_renditions_ready)
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает уменьшенные копии изображений рецептов '
+        'и отмечает рецепты с готовыми копиями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing-only', action='store_true',
+            help=(
+                'Обрабатывать только рецепты без отметки о готовых копиях; '
+                'уже созданные копии только отмечаются.'
+            )
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if options['missing_only']:
+            recipes = recipes.filter(renditions_ready=False)
+        image_names = recipes.values_list(
+            'image', flat=True
+        ).distinct().iterator()
+        processed = failed = 0
+        for image_name in image_names:
+            if options['missing_only'] and default_storage.exists(
+                get_rendition_name(image_name, 'full')
+            ):
+                mark_renditions_ready(image_name)
+                continue
+            try:
+                generate_renditions(image_name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{image_name}: {error}')
+                continue
+            mark_renditions_ready(image_name)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, с ошибками: {failed}'
+        ))
@@ -0,0 +1,67 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import (ingredient_catalog, recipe_fragments, recipe_responses,
+                       tag_catalog)
+from recipes.transfer import (FORMATS, TRANSFERS, get_format, iter_chunks,
+                              read_records)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает пользователей, ингредиенты, теги или рецепты '
+        'из файла JSON Lines или CSV пачками через bulk_create. '
+        'Рецепты загружаются после пользователей, тегов и ингредиентов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=TRANSFERS)
+        parser.add_argument(
+            'path', help='Путь к файлу, "-" для стандартного ввода.'
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки при записи в БД.'
+        )
+
+    def handle(self, *args, **options):
+        transfer = TRANSFERS[options['entity']]
+        path = options['path']
+        format_name = get_format(path, options['format'])
+        stream = (
+            sys.stdin if path == '-'
+            else open(path, encoding='utf-8', newline='')
+        )
+        loaded = 0
+        started = time.monotonic()
+        try:
+            records = read_records(stream, format_name, transfer)
+            for batch in iter_chunks(records, options['batch_size']):
+                with transaction.atomic():
+                    transfer.save_batch(batch)
+                loaded += len(batch)
+                if options['verbosity'] > 1:
+                    self.report(options['entity'], loaded, started)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        transfer.finish()
+        tag_catalog.invalidate()
+        ingredient_catalog.invalidate()
+        recipe_responses.invalidate()
+        recipe_fragments.invalidate()
+        self.report(options['entity'], loaded, started)
+
+    def report(self, entity, loaded, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{entity}: загружено {loaded} записей за {elapsed:.1f} с '
+            f'({loaded / max(elapsed, 1e-6):.0f} записей/с)'
+        )
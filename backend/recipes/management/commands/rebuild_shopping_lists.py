@@ -0,0 +1,117 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import IngredientInRecipe, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает сводные Списки покупок пользователей '
+        'из Списков покупок или проверяет их согласованность (--check).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить согласованность, ничего не меняя.'
+        )
+        parser.add_argument(
+            '--user', type=int, help='id пользователя.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки при записи в БД.'
+        )
+
+    def get_expected(self, user_id):
+        """
+        Суммы ингредиентов по Спискам покупок. Условие на Список
+        покупок задается одним filter, чтобы таблица присоединялась
+        один раз; сортировка по id, без сортировки связанных моделей.
+        """
+        if user_id is None:
+            rows = IngredientInRecipe.objects.filter(
+                recipe__is_in_shopping_cart__isnull=False
+            )
+        else:
+            rows = IngredientInRecipe.objects.filter(
+                recipe__is_in_shopping_cart__user_id=user_id
+            )
+        return rows.values_list(
+            'recipe__is_in_shopping_cart__user_id', 'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by(
+            'recipe__is_in_shopping_cart__user_id', 'ingredient_id'
+        ).iterator()
+
+    def get_actual(self, user_id):
+        items = ShoppingListItem.objects.filter(total__gt=0)
+        if user_id is not None:
+            items = items.filter(user_id=user_id)
+        return items.order_by('user_id', 'ingredient_id').values_list(
+            'user_id', 'ingredient_id', 'total'
+        ).iterator()
+
+    def count_mismatches(self, expected, actual):
+        """
+        Сравнивает два упорядоченных по (user, ingredient) потока строк,
+        не загружая их в память целиком.
+        """
+        mismatches = 0
+        expected_row = next(expected, None)
+        actual_row = next(actual, None)
+        while expected_row is not None or actual_row is not None:
+            if actual_row is None or (
+                expected_row is not None and expected_row[:2] < actual_row[:2]
+            ):
+                mismatches += 1
+                expected_row = next(expected, None)
+            elif expected_row is None or expected_row[:2] > actual_row[:2]:
+                mismatches += 1
+                actual_row = next(actual, None)
+            else:
+                mismatches += expected_row[2] != actual_row[2]
+                expected_row = next(expected, None)
+                actual_row = next(actual, None)
+        return mismatches
+
+    def rebuild(self, user_id, batch_size):
+        items = ShoppingListItem.objects.all()
+        if user_id is not None:
+            items = items.filter(user_id=user_id)
+        created = 0
+        with transaction.atomic():
+            items.delete()
+            rows = self.get_expected(user_id)
+            while True:
+                batch = [
+                    ShoppingListItem(
+                        user_id=user, ingredient_id=ingredient, total=total
+                    )
+                    for user, ingredient, total in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                ShoppingListItem.objects.bulk_create(batch)
+                created += len(batch)
+        return created
+
+    def handle(self, *args, **options):
+        user_id = options['user']
+        if options['check']:
+            mismatches = self.count_mismatches(
+                self.get_expected(user_id), self.get_actual(user_id)
+            )
+            if mismatches:
+                raise CommandError(
+                    f'Найдено расхождений: {mismatches}. '
+                    'Запустите команду без --check.'
+                )
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        created = self.rebuild(user_id, options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Записано строк Списка покупок: {created}')
+        )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import (COUNTERS, count_counter_mismatches,
+                              reconcile_counter)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счетчики избранного, списков покупок, рецептов '
+        'и подписчиков или проверяет их (--check). Нужна после '
+        'изменений в обход приложения: SQL напрямую, загрузки данных '
+        'или bulk_create без обновления счетчиков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить счетчики, ничего не меняя.'
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = 0
+            for model, field, related_model, related_field in COUNTERS:
+                count = count_counter_mismatches(
+                    model, field, related_model, related_field
+                )
+                mismatches += count
+                self.stdout.write(
+                    f'{model._meta.model_name}.{field}: '
+                    f'расхождений {count}'
+                )
+            if mismatches:
+                raise CommandError(
+                    'Счетчики расходятся с данными. '
+                    'Запустите команду без --check.'
+                )
+            return
+        with transaction.atomic():
+            for model, field, related_model, related_field in COUNTERS:
+                updated = reconcile_counter(
+                    model, field, related_model, related_field
+                )
+                self.stdout.write(
+                    f'{model._meta.model_name}.{field}: '
+                    f'пересчитано {updated}'
+                )
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.14 on 2026-10-17 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='renditions_ready',
+            field=models.BooleanField(default=False, verbose_name='Уменьшенные копии готовы'),
+        ),
+    ]
@@ -111,8 +111,37 @@ class Recipe(models.Model):
         db_index=True
     )
 
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Добавлений в избранное',
+    )
+
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Добавлений в список покупок',
+    )
+
+    renditions_ready = models.BooleanField(
+        default=False,
+        verbose_name='Уменьшенные копии готовы',
+    )
+
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date'],
+                name='recipe_popular_idx',
+            ),
+        ]
         verbose_name = 'recipe'
         verbose_name_plural = 'recipes'
 
@@ -151,6 +180,12 @@ class IngredientInRecipe(models.Model):
                 name='unique_ingredient_in_recipe',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient', 'amount'],
+                name='ingredient_in_recipe_amt_idx',
+            ),
+        ]
         verbose_name = 'ingredient'
         verbose_name_plural = 'ingredients'
 
@@ -203,3 +238,37 @@ class ShoppingCart(models.Model):
         ]
         verbose_name = 'shopping cart'
         verbose_name_plural = 'shopping carts'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Модель Ингредиента в сводном Списке покупок пользователя.
+    Хранит суммарное количество ингредиента по всем рецептам
+    из Списка покупок и обновляется при изменении Списка покупок.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items',
+    )
+    total = models.IntegerField(
+        default=0,
+        verbose_name='Общее количество ингредиента',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            ),
+        ]
+        verbose_name = 'shopping list item'
+        verbose_name_plural = 'shopping list items'
@@ -0,0 +1,106 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import IngredientInRecipe, ShoppingCart, ShoppingListItem
+
+
+def get_recipe_amounts(recipe_id):
+    """Возвращает количество каждого ингредиента рецепта"""
+    return dict(
+        IngredientInRecipe.objects.filter(recipe_id=recipe_id).values_list(
+            'ingredient_id', 'amount'
+        )
+    )
+
+
+def get_recipes_amounts(recipe_ids):
+    """Возвращает суммарное количество каждого ингредиента рецептов"""
+    return dict(
+        IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids).values(
+            'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by().values_list(
+            'ingredient_id', 'total'
+        )
+    )
+
+
+def apply_shopping_list_delta(user_ids, delta):
+    """
+    Прибавляет к сводным Спискам покупок пользователей user_ids
+    изменение количества ингредиентов delta {ingredient_id: amount}.
+    Недостающие строки создаются, обнулившиеся удаляются.
+    """
+    delta = {
+        ingredient_id: amount
+        for ingredient_id, amount in delta.items() if amount
+    }
+    if not user_ids or not delta:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id, amount in delta.items() if amount > 0
+            ],
+            ignore_conflicts=True
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=delta
+        )
+        items.update(total=F('total') + Case(
+            *[
+                When(ingredient_id=ingredient_id, then=Value(amount))
+                for ingredient_id, amount in delta.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+        if any(amount < 0 for amount in delta.values()):
+            items.filter(total__lte=0).delete()
+
+
+def add_recipe_to_shopping_list(user_id, recipe_id):
+    apply_shopping_list_delta([user_id], get_recipe_amounts(recipe_id))
+
+
+def remove_recipe_from_shopping_list(user_id, recipe_id):
+    amounts = get_recipe_amounts(recipe_id)
+    apply_shopping_list_delta(
+        [user_id],
+        {ingredient_id: -amount for ingredient_id, amount in amounts.items()}
+    )
+
+
+def add_recipes_to_shopping_list(user_id, recipe_ids):
+    apply_shopping_list_delta([user_id], get_recipes_amounts(recipe_ids))
+
+
+def remove_recipes_from_shopping_list(user_id, recipe_ids):
+    amounts = get_recipes_amounts(recipe_ids)
+    apply_shopping_list_delta(
+        [user_id],
+        {ingredient_id: -amount for ingredient_id, amount in amounts.items()}
+    )
+
+
+def update_recipe_in_shopping_lists(recipe_id, old_amounts, new_amounts):
+    """
+    Переносит изменение ингредиентов рецепта в сводные Списки покупок
+    всех пользователей, у которых рецепт в Списке покупок.
+    """
+    delta = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    if not any(delta.values()):
+        return
+    user_ids = list(
+        ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+            'user_id', flat=True
+        )
+    )
+    apply_shopping_list_delta(user_ids, delta)
@@ -0,0 +1,265 @@
+import csv
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Case, DateTimeField, Value, When
+
+from users.models import User
+from .counters import reconcile_counter
+from .models import Ingredient, IngredientInRecipe, Recipe, Tag
+
+
+class ModelTransfer:
+    """
+    Выгрузка и загрузка объектов модели плоскими записями.
+    Из БД объекты читаются пачками по возрастанию id,
+    в БД записываются пачками через bulk_create, поэтому
+    расход памяти ограничен размером пачки.
+    Записи должны содержать id: он сохраняется при загрузке,
+    уже существующие объекты пропускаются.
+    """
+    model = None
+    fields = ()
+    nested_fields = ()
+
+    @property
+    def columns(self):
+        return self.fields + self.nested_fields
+
+    def iter_batches(self, batch_size):
+        last_id = 0
+        while True:
+            rows = list(
+                self.model.objects.filter(pk__gt=last_id).order_by(
+                    'pk'
+                ).values(*self.fields)[:batch_size]
+            )
+            if not rows:
+                return
+            last_id = rows[-1]['id']
+            self.add_nested(rows)
+            yield [self.to_record(row) for row in rows]
+
+    def add_nested(self, rows):
+        pass
+
+    def to_record(self, row):
+        return {
+            name: (
+                value.isoformat() if isinstance(value, (date, datetime))
+                else value
+            )
+            for name, value in row.items()
+        }
+
+    def build(self, record):
+        values = {}
+        for name in self.fields:
+            if name not in record:
+                continue
+            field = self.model._meta.get_field(name)
+            value = record[name]
+            if value == '' and field.null:
+                value = None
+            values[field.attname] = field.to_python(value)
+        return self.model(**values)
+
+    def save_batch(self, records):
+        self.model.objects.bulk_create(
+            [self.build(record) for record in records],
+            ignore_conflicts=True
+        )
+
+    def finish(self):
+        """Сдвигает последовательности id после загрузки с явными id"""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [self.model]
+            ):
+                cursor.execute(sql)
+
+
+class IngredientTransfer(ModelTransfer):
+    model = Ingredient
+    fields = ('id', 'name', 'measurement_unit')
+
+
+class TagTransfer(ModelTransfer):
+    model = Tag
+    fields = ('id', 'name', 'color', 'slug')
+
+
+class UserTransfer(ModelTransfer):
+    model = User
+    fields = (
+        'id', 'email', 'username', 'first_name', 'last_name', 'password',
+        'role', 'is_staff', 'is_superuser', 'is_active', 'date_joined',
+        'last_login'
+    )
+
+
+class RecipeTransfer(ModelTransfer):
+    """
+    Рецепты выгружаются вместе с id тегов и ингредиентами
+    [{"id": ..., "amount": ...}]. Файлы изображений не переносятся,
+    сохраняется только путь к изображению в хранилище.
+    """
+    model = Recipe
+    fields = (
+        'id', 'author', 'name', 'image', 'text', 'cooking_time', 'pub_date'
+    )
+    nested_fields = ('tags', 'ingredients')
+
+    def add_nested(self, rows):
+        recipe_ids = [row['id'] for row in rows]
+        tags = defaultdict(list)
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('recipe_id', 'tag_id').values_list('recipe_id', 'tag_id'):
+            tags[recipe_id].append(tag_id)
+        ingredients = defaultdict(list)
+        for recipe_id, ingredient_id, amount in (
+            IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by('recipe_id', 'ingredient_id').values_list(
+                'recipe_id', 'ingredient_id', 'amount'
+            )
+        ):
+            ingredients[recipe_id].append(
+                {'id': ingredient_id, 'amount': amount}
+            )
+        for row in rows:
+            row['tags'] = tags[row['id']]
+            row['ingredients'] = ingredients[row['id']]
+
+    def save_batch(self, records):
+        """
+        Дата публикации, теги и ингредиенты записываются только
+        для рецептов, которых до загрузки не было в БД:
+        существующие рецепты не меняются.
+        """
+        records_by_id = {}
+        for record in records:
+            records_by_id.setdefault(int(record['id']), record)
+        existing_ids = set(Recipe.objects.filter(
+            pk__in=records_by_id
+        ).values_list('pk', flat=True))
+        records = [
+            record for recipe_id, record in records_by_id.items()
+            if recipe_id not in existing_ids
+        ]
+        if not records:
+            return
+        super().save_batch(records)
+        recipe_ids = [int(record['id']) for record in records]
+        # bulk_create подставляет текущее время в поле с auto_now_add
+        pub_date_field = Recipe._meta.get_field('pub_date')
+        pub_dates = [
+            When(
+                pk=recipe_id,
+                then=Value(pub_date_field.to_python(record['pub_date']))
+            )
+            for recipe_id, record in zip(recipe_ids, records)
+            if record.get('pub_date')
+        ]
+        if pub_dates:
+            Recipe.objects.filter(pk__in=recipe_ids).update(
+                pub_date=Case(
+                    *pub_dates, default='pub_date',
+                    output_field=DateTimeField()
+                )
+            )
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id, record in zip(recipe_ids, records)
+                for tag_id in record.get('tags', ())
+            ],
+            ignore_conflicts=True
+        )
+        IngredientInRecipe.objects.bulk_create(
+            [
+                IngredientInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient['id'],
+                    amount=ingredient['amount']
+                )
+                for recipe_id, record in zip(recipe_ids, records)
+                for ingredient in record.get('ingredients', ())
+            ],
+            ignore_conflicts=True
+        )
+
+    def finish(self):
+        super().finish()
+        reconcile_counter(User, 'recipes_count', Recipe, 'author')
+
+
+TRANSFERS = {
+    'users': UserTransfer(),
+    'ingredients': IngredientTransfer(),
+    'tags': TagTransfer(),
+    'recipes': RecipeTransfer(),
+}
+
+FORMATS = ('jsonl', 'csv')
+
+
+def get_format(path, format_name=None):
+    if format_name:
+        return format_name
+    if path.endswith('.csv'):
+        return 'csv'
+    return 'jsonl'
+
+
+def read_records(stream, format_name, transfer):
+    """
+    Построчно читает записи из потока: JSON Lines разбирается
+    по одной строке, в CSV вложенные поля хранятся как JSON.
+    """
+    if format_name == 'csv':
+        for row in csv.DictReader(stream):
+            for name in transfer.nested_fields:
+                if row.get(name):
+                    row[name] = json.loads(row[name])
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_records(stream, format_name, transfer, batches):
+    """Записывает пачки записей в поток, возвращает число записей"""
+    written = 0
+    if format_name == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=transfer.columns)
+        writer.writeheader()
+    for batch in batches:
+        for record in batch:
+            if format_name == 'csv':
+                writer.writerow({
+                    name: (
+                        json.dumps(value) if name in transfer.nested_fields
+                        else value
+                    )
+                    for name, value in record.items()
+                })
+            else:
+                stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        written += len(batch)
+        yield written
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
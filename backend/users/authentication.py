@@ -0,0 +1,107 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenUserCache:
+    """
+    Ограниченный по размеру LRU-кэш токен -> (пользователь, токен)
+    в памяти процесса. Записи живут не дольше ttl секунд.
+    Запись хранит версию авторизации пользователя из общего кэша
+    и при каждом чтении сверяется с ней: сброс записей при выходе,
+    смене пароля и сохранении пользователя меняет версию
+    и виден всем процессам с тем же бэкендом кэша.
+    """
+    cache_alias = 'default'
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_version_key(self, user_id):
+        return f'auth:{user_id}:version'
+
+    def get_version(self, user_id):
+        version_key = self.get_version_key(user_id)
+        version = self.cache.get(version_key)
+        if version is None:
+            self.cache.add(version_key, uuid.uuid4().hex, None)
+            version = self.cache.get(version_key)
+        return version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, user, token, version = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        if version != self.get_version(user.pk):
+            self.invalidate_token(key)
+            return None
+        return copy.copy(user), token
+
+    def set(self, key, user, token):
+        version = self.get_version(user.pk)
+        with self._lock:
+            self._entries[key] = (
+                time.monotonic() + self.ttl, user, token, version
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_token(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        """Сбрасывает записи пользователя во всех процессах"""
+        self.cache.set(self.get_version_key(user_id), uuid.uuid4().hex, None)
+        with self._lock:
+            for key in [
+                key for key, (_, user, _, _) in self._entries.items()
+                if user.pk == user_id
+            ]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_user_cache = TokenUserCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену, запоминающая пользователя токена,
+    чтобы не обращаться к БД на каждый запрос: вместо запроса к БД
+    из общего кэша читается версия авторизации пользователя.
+    Каждому запросу выдается своя копия пользователя.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_user_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_user_cache.set(key, copy.copy(user), token)
+        return user, token
@@ -1,6 +1,7 @@
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 
+from api.fields import ImageRenditionsField
 from recipes.models import Recipe
 from .models import Subscription, User
 
@@ -9,10 +10,12 @@ class LimitedListSerializer(serializers.ListSerializer):
     """Сериализатор для ограничения выдачи рецептов в подписках"""
 
     def to_representation(self, data):
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit'
-        )
-        data = data.all()[:int(recipes_limit)]
+        request = self.context.get('request')
+        data = data.all()
+        if request is not None:
+            recipes_limit = request.query_params.get('recipes_limit')
+            if recipes_limit and recipes_limit.isdigit():
+                data = data[:int(recipes_limit)]
         return super().to_representation(data)
 
 
@@ -33,6 +36,8 @@ class UserSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'subscribed'):
+            return obj.subscribed
         return Subscription.objects.filter(
             user=request.user, author=obj).exists()
 
@@ -70,11 +75,12 @@ class PasswordSerializer(serializers.ModelSerializer):
 
 class RecipeSimpleSerializer(serializers.ModelSerializer):
     """Сериализатор модели Recipe вывода данных о рецепте"""
+    thumbnail = ImageRenditionsField(source='image', rendition='thumbnail')
 
     class Meta:
         list_serializer_class = LimitedListSerializer
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'thumbnail', 'cooking_time',)
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -114,12 +120,10 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
-        if request.method in ['POST']:
-            return Subscription.objects.filter(
-                user=request.user, author=obj).exists()
-        if request.method in ['GET']:
-            return Subscription.objects.filter(
-                user=request.user, author=obj.author).exists()
+        if obj.user_id == request.user.id:
+            return True
+        return Subscription.objects.filter(
+            user=request.user, author_id=obj.author_id).exists()
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author.id).count()
+        return obj.author.recipes_count
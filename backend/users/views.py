@@ -1,4 +1,6 @@
 from django.contrib.auth.hashers import check_password
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status, viewsets
@@ -8,6 +10,10 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api.batch import add_batch, batch_results, delete_batch, get_batch_ids
+from api.mixins import AsyncReadViewMixin
+from recipes.counters import change_counter, change_counters
+from recipes.models import Recipe
 from .models import Subscription, User
 from .serializers import (PasswordSerializer, SubscriptionSerializer,
                           UserRegistrationSerializer, UserSerializer)
@@ -40,29 +46,62 @@ class UserViewSet(DjoserUserViewSet):
         if request.method == 'POST':
             serializer = SubscriptionSerializer(
                 data=request.data, context={
-                    'pk': id, 'user': self.request.user
+                    'pk': id, 'user': self.request.user, 'request': request
                 }
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save(
-                author_id=id,
-                user=self.request.user
-            )
+            try:
+                with transaction.atomic():
+                    serializer.save(
+                        author_id=id,
+                        user=self.request.user
+                    )
+                    change_counter(User, id, 'subscribers_count', 1)
+            except IntegrityError:
+                return Response(
+                    {'Вы уже подписаны на этого автора'},
+                    status=status.HTTP_400_BAD_REQUEST)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             user = self.request.user
             author = get_object_or_404(User, pk=id)
-            subscription = Subscription.objects.filter(
-                user=user, author=author
-            )
-            if subscription.exists():
-                subscription.delete()
+            with transaction.atomic():
+                _, deleted = delete_batch(
+                    Subscription, 'author', user, [author.id]
+                )
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             else:
                 return Response(
                     {'Вы не были подписаны на этого пользователя'},
                     status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=['post', 'delete'],
+            detail=False,
+            permission_classes=(IsAuthenticated,),
+            url_path='subscribe/batch',)
+    def subscribe_batch(self, request):
+        """
+        Метод для создания и удаления Подписок
+        на нескольких авторов одним запросом.
+        """
+        author_ids = get_batch_ids(request)
+        with transaction.atomic():
+            if request.method == 'POST':
+                statuses, changed_ids = add_batch(
+                    Subscription, 'author', request.user, author_ids,
+                    forbidden_ids=[request.user.id]
+                )
+                if changed_ids:
+                    change_counters(
+                        User, changed_ids, 'subscribers_count', 1
+                    )
+            else:
+                statuses, _ = delete_batch(
+                    Subscription, 'author', request.user, author_ids
+                )
+        return Response(batch_results(statuses))
+
 
 class APIChangePassword(APIView):
     """
@@ -86,13 +125,43 @@ class APIChangePassword(APIView):
                         status=status.HTTP_400_BAD_REQUEST)
 
 
-class SubscriptionViewSet(viewsets.ModelViewSet):
-    """Вьюсет для получения Подписок."""
+class SubscriptionViewSet(AsyncReadViewMixin, viewsets.ModelViewSet):
+    """
+    Вьюсет для получения Подписок.
+    При ASGI выполняется в пуле потоков БД.
+    """
     permission_classes = (IsAuthenticated,)
     pagination_class = PageNumberPagination
     serializer_class = SubscriptionSerializer
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            return int(recipes_limit)
+        return None
+
     def get_queryset(self):
+        """
+        Количество рецептов автора берется из счетчика автора,
+        а рецепты авторов подгружаются одним запросом.
+        При заданном recipes_limit для каждого автора выбираются
+        только последние recipes_limit рецептов.
+        """
         user = self.request.user
-        queryset = Subscription.objects.filter(user=user)
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'renditions_ready', 'cooking_time',
+            'author', 'pub_date'
+        )
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('id')[:recipes_limit]
+            ))
+        queryset = Subscription.objects.filter(user=user).select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch('author__recipes', queryset=recipes)
+        ).order_by('id')
         return queryset